@@ -0,0 +1,53 @@
+"""
+Shared helpers for the benchmark scripts: point the app at a throwaway database and seed users.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+BATCH = 10000
+
+NAMES = ['Maria', 'Mario', 'Lucia', 'Pablo', 'Ana', 'Javier', 'Carmen', 'Hugo', 'Sofia', 'Martin', 'Iñigo', 'Begoña']
+LAST_NAMES = ['Garcia', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez', 'Ruiz', 'Diaz', 'Muñoz']
+LOCATIONS = ['Madrid', 'Barcelona', 'Sevilla', 'Valencia', 'Bilbao', 'Malaga', 'Marbella']
+LANGUAGES = ['Spanish', 'English', 'French', 'Portuguese', 'German', 'Italian']
+WORDS = ['cook', 'pasta', 'guitar', 'piano', 'paint', 'football', 'tennis', 'teach', 'learn', 'music', 'art', 'yoga']
+
+
+def setup_app(name):
+    """Import the app bound to BENCH_DATABASE_URL, or to a fresh SQLite file in /tmp."""
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if url is None:
+        path = f'/tmp/{name}.db'
+        if os.path.exists(path):
+            os.remove(path)
+        url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = url
+
+    from app import create_app
+    from api.models import db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def seed_users(count, seed=42):
+    from api.models import db, User
+    rnd = random.Random(seed)
+    for start in range(0, count, BATCH):
+        db.session.bulk_insert_mappings(User, [{
+            'email': f'bench{i}@test.com',
+            'password': 'x',
+            'is_active': True,
+            'name': rnd.choice(NAMES),
+            'last_name': rnd.choice(LAST_NAMES),
+            'location': rnd.choice(LOCATIONS),
+            'language': rnd.choice(LANGUAGES),
+            'description': ' '.join(rnd.choices(WORDS, k=8)),
+            'average_score': rnd.choice([3, 3.5, 4, 4.25, 5]),
+        } for i in range(start, min(start + BATCH, count))])
+        db.session.commit()
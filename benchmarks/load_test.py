@@ -0,0 +1,337 @@
+"""
+Load test for the Flask API.
+
+Boots src/app.py on a local port against a freshly seeded database (SQLite in /tmp by default, or
+BENCH_DATABASE_URL), then drives a weighted mix of realistic workflows from concurrent clients and
+reports, per endpoint, p50/p95/p99 latency, throughput, status codes and SQL queries per request.
+Results are written as JSON so two commits can be compared:
+
+    $ python benchmarks/load_test.py --users 10000 --concurrency 16 --duration 30 --output before.json
+    $ python benchmarks/load_test.py --users 10000 --concurrency 16 --duration 30 --output after.json
+    $ python benchmarks/load_test.py --compare before.json after.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from common import setup_app, seed_users
+
+PASSWORD = 'Password1234'
+SKILLS = ['Cooking', 'Sports', 'Music', 'Languages', 'Art', 'Others']
+SEARCH_QUERIES = ['madrid', 'mar', 'guitar', 'english', 'cook pasta', 'lopez', 'paint', 'sevilla']
+SKILL_QUERIES = ['cook', 'mus', 'sport', 'art', 'lang', 'cook,music']
+
+# Scenario name -> weight, roughly what the frontend does
+MIX = {
+    'profile_read': 25,
+    'search': 20,
+    'skill_search': 10,
+    'list_users': 10,
+    'full_profile': 10,
+    'best_sharers': 10,
+    'login': 5,
+    'review_write': 5,
+    'match_workflow': 5,
+}
+
+
+def seed(app, users, drivers):
+    from api.models import db, User, Categories, Review
+    from api.search import install_search_index
+    from api.models import update_best_sharers, rebuild_review_aggregates
+    import bcrypt
+
+    rnd = random.Random(7)
+    with app.app_context():
+        seed_users(users)
+
+        categories = []
+        for user_id in range(1, users + 1):
+            for skill in rnd.sample(SKILLS, rnd.randint(0, 3)):
+                categories.append({'user_id': user_id, 'skill_name': skill, 'description': 'I can teach it'})
+        db.session.bulk_insert_mappings(Categories, categories)
+
+        # Drivers (the first ids) never review each other, the review workflow writes those
+        pairs = set()
+        while len(pairs) < users * 2:
+            pairs.add((rnd.randint(drivers + 1, users), rnd.randint(drivers + 1, users)))
+        db.session.bulk_insert_mappings(Review, [
+            {'reviewer_id': reviewer, 'reviewee_id': reviewee, 'score': rnd.randint(1, 5), 'comment': 'Great'}
+            for reviewer, reviewee in pairs if reviewer != reviewee
+        ])
+
+        pw_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(app.config['BCRYPT_LOG_ROUNDS'])).decode()
+        User.query.filter(User.id <= drivers).update({User.password: pw_hash}, synchronize_session=False)
+        db.session.commit()
+
+        # Same aggregates the API maintains on every review change
+        for start in range(1, users + 1, 10000):
+            rebuild_review_aggregates(list(range(start, min(start + 10000, users + 1))))
+            db.session.commit()
+        update_best_sharers()
+        install_search_index()
+
+
+def instrument(app):
+    """Count the SQL statements of every request and return them in a response header."""
+    from flask import g, has_request_context
+    from sqlalchemy import event
+    from api.models import db
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            if has_request_context():
+                g.bench_sql_queries = g.get('bench_sql_queries', 0) + 1
+
+    @app.after_request
+    def add_query_count(response):
+        response.headers['X-Bench-SQL-Queries'] = str(g.get('bench_sql_queries', 0))
+        return response
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Client:
+    def __init__(self, port, stats):
+        self.port = port
+        self.stats = stats
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, endpoint, method, path, body=None, token=None, expected=(200, 201)):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        payload = json.dumps(body) if body is not None else None
+
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # Reconnect and count it as an error
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.stats.record(endpoint, time.perf_counter() - start, 599, 0, expected)
+            return 599, None
+        elapsed = time.perf_counter() - start
+
+        queries = int(response.getheader('X-Bench-SQL-Queries', 0))
+        self.stats.record(endpoint, elapsed, response.status, queries, expected)
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.unexpected = defaultdict(int)
+
+    def record(self, endpoint, seconds, status, queries, expected):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.queries[endpoint].append(queries)
+            self.statuses[endpoint][status] += 1
+            if status not in expected:
+                self.unexpected[endpoint] += 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'throughput_rps': round(len(samples) / duration, 2),
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                'mean_ms': round(statistics.mean(samples) * 1000, 2),
+                'sql_queries_per_request': round(statistics.mean(self.queries[endpoint]), 2),
+                'sql_queries_max': max(self.queries[endpoint]),
+                'statuses': {str(status): count for status, count in sorted(self.statuses[endpoint].items())},
+                'unexpected_statuses': self.unexpected[endpoint],
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {'total_requests': total, 'throughput_rps': round(total / duration, 2), 'endpoints': endpoints}
+
+
+def percentile(sorted_samples, pct):
+    index = max(0, int(round(pct / 100 * len(sorted_samples))) - 1)
+    return sorted_samples[index]
+
+
+def login(client, driver_id):
+    status, body = client.request('POST /login', 'POST', '/login',
+                                  {'email': f'bench{driver_id - 1}@test.com', 'password': PASSWORD})
+    return body['access_token'] if status == 200 else None
+
+
+def worker(port, stats, tokens, users, deadline, seed_value):
+    rnd = random.Random(seed_value)
+    client = Client(port, stats)
+    scenarios, weights = zip(*MIX.items())
+    driver_ids = list(tokens)
+
+    while time.perf_counter() < deadline:
+        scenario = rnd.choices(scenarios, weights)[0]
+        me = rnd.choice(driver_ids)
+        token = tokens[me]
+        user_id = rnd.randint(1, users)
+
+        if scenario == 'profile_read':
+            client.request('GET /profile/<id>', 'GET', f'/profile/{user_id}')
+            client.request('GET /user/<id>/reviews', 'GET', f'/user/{user_id}/reviews')
+        elif scenario == 'full_profile':
+            client.request('GET /profile/<id>/full', 'GET', f'/profile/{user_id}/full')
+        elif scenario == 'search':
+            client.request('GET /search/users', 'GET', f'/search/users?query={rnd.choice(SEARCH_QUERIES).replace(" ", "%20")}',
+                           expected=(200, 404))
+        elif scenario == 'skill_search':
+            client.request('GET /search/usersbyskill', 'GET', f'/search/usersbyskill?skill={rnd.choice(SKILL_QUERIES)}',
+                           expected=(200, 404))
+        elif scenario == 'list_users':
+            client.request('GET /users', 'GET', '/users?limit=100')
+        elif scenario == 'best_sharers':
+            client.request('GET /bestsharers', 'GET', '/bestsharers')
+        elif scenario == 'login':
+            login(client, me)
+            client.request('GET /profile', 'GET', '/profile', token=token)
+        elif scenario == 'review_write':
+            status, body = client.request('POST /add/review', 'POST', '/add/review',
+                                          {'reviewee_id': user_id, 'score': rnd.randint(1, 5), 'comment': 'Load test'},
+                                          token=token, expected=(201, 400))
+            if status == 201:
+                review_id = body['review_id']
+                client.request('PUT /update/review/<id>', 'PUT', f'/update/review/{review_id}',
+                               {'score': rnd.randint(1, 5)}, token=token)
+                client.request('DELETE /reviews/<id>', 'DELETE', f'/reviews/{review_id}', token=token)
+        elif scenario == 'match_workflow':
+            other = rnd.choice(driver_ids)
+            if other == me:
+                continue
+            status, _ = client.request('POST /match', 'POST', '/match', {'match_to_id': other}, token=token,
+                                       expected=(201, 400))
+            status, incoming = client.request('GET /match?type=incoming', 'GET', '/match?type=incoming', token=tokens[other])
+            mine = [match for match in incoming if match.get('match_from_id') == me] if isinstance(incoming, list) else []
+            for match in mine:
+                client.request('PUT /match/<id>', 'PUT', f'/match/{match["match_id"]}',
+                               {'match_status': 'Accepted'}, token=tokens[other])
+                client.request('GET /match?type=accepted', 'GET', '/match?type=accepted', token=token)
+                client.request('DELETE /match/<id>', 'DELETE', f'/match/{match["match_id"]}', token=token,
+                               expected=(200, 404))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    print(f'\n{"endpoint":<30} {"reqs":>7} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"sql/req":>8} {"unexp":>6}')
+    for endpoint, row in results['summary']['endpoints'].items():
+        print(f'{endpoint:<30} {row["requests"]:>7} {row["throughput_rps"]:>8} {row["p50_ms"]:>8} '
+              f'{row["p95_ms"]:>8} {row["p99_ms"]:>8} {row["sql_queries_per_request"]:>8} {row["unexpected_statuses"]:>6}')
+    print(f'\ntotal: {results["summary"]["total_requests"]} requests, {results["summary"]["throughput_rps"]} req/s')
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f'{before.get("commit")} -> {after.get("commit")}')
+    print(f'{"endpoint":<30} {"p95 before":>11} {"p95 after":>10} {"sql before":>11} {"sql after":>10}')
+    for endpoint, row in after['summary']['endpoints'].items():
+        old = before['summary']['endpoints'].get(endpoint)
+        if old is None:
+            print(f'{endpoint:<30} {"-":>11} {row["p95_ms"]:>10} {"-":>11} {row["sql_queries_per_request"]:>10}')
+            continue
+        print(f'{endpoint:<30} {old["p95_ms"]:>11} {row["p95_ms"]:>10} '
+              f'{old["sql_queries_per_request"]:>11} {row["sql_queries_per_request"]:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000, help='users seeded in the database')
+    parser.add_argument('--drivers', type=int, default=50, help='seeded accounts the clients log in with')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '10')
+    app = setup_app('load_test')
+    # Integer identities, newer flask-jwt-extended versions reject them unless told otherwise
+    app.config['JWT_VERIFY_SUB'] = False
+
+    print(f'Seeding {args.users} users...')
+    seed(app, args.users, args.drivers)
+    instrument(app)
+    server = serve(app)
+    port = server.server_port
+
+    setup_client = Client(port, Stats())
+    tokens = {driver_id: login(setup_client, driver_id) for driver_id in range(1, args.drivers + 1)}
+    tokens = {driver_id: token for driver_id, token in tokens.items() if token}
+
+    print(f'Running {args.concurrency} clients for {args.duration}s against 127.0.0.1:{port}...')
+    stats = Stats()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(port, stats, tokens, args.users, deadline, args.seed + i))
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'mix': MIX,
+        'summary': stats.summary(elapsed),
+    }
+    print_report(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
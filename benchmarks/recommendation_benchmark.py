@@ -0,0 +1,121 @@
+"""
+Recommendation benchmark: GET /recommendations scoring with NumPy vs the same score computed by a
+per-candidate Python loop, plus the cost of loading the snapshot, of an incremental refresh after a
+skill change and of a cached ranking.
+
+Seeds a fresh SQLite database (or BENCH_DATABASE_URL) for every size:
+    $ python benchmarks/recommendation_benchmark.py 10000 100000
+"""
+import random
+import statistics
+import sys
+import time
+from common import setup_app, seed_users
+
+SIZES = [int(size) for size in sys.argv[1:]] or [100000]
+REPEAT = 20
+LOOP_REPEAT = 3
+
+
+def timed(func, repeat=REPEAT):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[max(int(len(samples) * 0.95) - 1, 0)]
+
+
+def seed_relations(size, seed=42):
+    from api.models import db, Categories, Match, MatchStatus, SkillNameEnum
+    rnd = random.Random(seed)
+    skills = [skill.value for skill in SkillNameEnum]
+    statuses = [status.value for status in MatchStatus]
+    categories, matches = [], []
+    for user_id in range(1, size + 1):
+        for skill in rnd.sample(skills, rnd.randint(0, 3)):
+            categories.append({'user_id': user_id, 'skill_name': skill})
+        for other in rnd.sample(range(1, size + 1), 3):
+            if other != user_id:
+                matches.append({'match_from_id': user_id, 'match_to_id': other, 'match_status': rnd.choice(statuses)})
+    db.session.execute(Categories.__table__.insert(), categories)
+    db.session.execute(Match.__table__.insert(), matches)
+    db.session.commit()
+
+
+def python_loop(snapshot, user_id, excluded_ids):
+    # The scoring of Snapshot.score() one candidate at a time, as a baseline
+    from api.recommendations import WEIGHTS, MAX_RESULTS
+    ids, skills, location, language = snapshot.ids.tolist(), snapshot.skills.tolist(), snapshot.location.tolist(), snapshot.language.tolist()
+    rating, active = snapshot.rating.tolist(), snapshot.active.tolist()
+    position = snapshot.positions[user_id]
+    mine = skills[position]
+    excluded = set(excluded_ids) | {user_id}
+    scored = []
+    for candidate in range(len(ids)):
+        if not active[candidate] or ids[candidate] in excluded:
+            continue
+        learn = bin(skills[candidate] & ~mine).count('1')
+        if not learn:
+            continue
+        teach = bin(mine & ~skills[candidate]).count('1')
+        score = (WEIGHTS['exchange'] * min(learn, teach) + WEIGHTS['learn'] * learn
+                 + WEIGHTS['location'] * (location[candidate] == location[position] and location[position] >= 0)
+                 + WEIGHTS['language'] * bool(language[candidate] & language[position])
+                 + WEIGHTS['rating'] * (rating[candidate] - 1) / 4)
+        scored.append((-score, ids[candidate]))
+    scored.sort()
+    return scored[:MAX_RESULTS]
+
+
+def run(size):
+    app = setup_app(f'recommendation_benchmark_{size}')
+    from api.models import db, Categories
+    from api.recommendations import index, matched_user_ids
+
+    with app.app_context():
+        seed_users(size)
+        seed_relations(size)
+        user_ids = random.Random(7).sample(range(1, size + 1), REPEAT)
+        excluded = {user_id: matched_user_ids(user_id) for user_id in user_ids}
+        print(f'\n{size} users')
+
+        build = timed(index.build, repeat=3)
+        snapshot = index.snapshot
+        print(f'{"snapshot load":<28} {build[0]:>10.2f} ms p50 {build[1]:>10.2f} ms p95')
+
+        samples = iter(user_ids * 2)
+        numpy_score = timed(lambda: snapshot.score(user_id := next(samples), excluded[user_id]))
+        print(f'{"score, numpy":<28} {numpy_score[0]:>10.2f} ms p50 {numpy_score[1]:>10.2f} ms p95')
+
+        samples = iter(user_ids * 2)
+        loop_score = timed(lambda: python_loop(snapshot, user_id := next(samples), excluded[user_id]), repeat=LOOP_REPEAT)
+        print(f'{"score, python loop":<28} {loop_score[0]:>10.2f} ms p50 {loop_score[1]:>10.2f} ms p95'
+              f'  ({loop_score[0] / numpy_score[0]:.0f}x slower)')
+
+        # Same top entries both ways
+        user_id = user_ids[0]
+        expected = [candidate for _, candidate in python_loop(snapshot, user_id, excluded[user_id])]
+        assert [candidate for candidate, *_ in snapshot.score(user_id, excluded[user_id])] == expected
+
+        def add_skill_and_refresh():
+            skill = db.session.query(Categories).filter_by(user_id=user_id).first()
+            if skill is not None:
+                db.session.delete(skill)
+            else:
+                db.session.add(Categories(user_id=user_id, skill_name='Others'))
+            db.session.commit()
+            index.refresh_stale()
+        refresh = timed(add_skill_and_refresh)
+        print(f'{"skill change + refresh":<28} {refresh[0]:>10.2f} ms p50 {refresh[1]:>10.2f} ms p95')
+
+        index.recommend(user_id)
+        cached = timed(lambda: index.recommend(user_id))
+        print(f'{"cached ranking":<28} {cached[0]:>10.4f} ms p50 {cached[1]:>10.4f} ms p95')
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    for size in SIZES:
+        run(size)
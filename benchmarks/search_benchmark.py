@@ -0,0 +1,47 @@
+"""
+Search latency benchmark: old ilike('%q%') scan vs the full-text index used by /search/users.
+
+Seeds a fresh SQLite database (or BENCH_DATABASE_URL) for every size and times both paths:
+    $ python benchmarks/search_benchmark.py 10000 100000 1000000
+"""
+import statistics
+import sys
+import time
+from common import setup_app, seed_users
+
+SIZES = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+QUERIES = ['madrid', 'mar', 'guitar', 'english', 'cook pasta', 'lopez', 'paint']
+REPEAT = 20
+
+
+def timed(func):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def run(size):
+    app = setup_app(f'search_benchmark_{size}')
+    from api.models import db
+    from api.search import install_search_index, search_users, _search_ilike
+
+    with app.app_context():
+        seed_users(size)
+        install_search_index()
+
+        print(f'\n{size} users')
+        print(f'{"query":<12} {"ilike p50":>10} {"ilike p95":>10} {"fts p50":>10} {"fts p95":>10}  (ms; ilike returns every match like the old endpoint, fts one page of 50)')
+        for query in QUERIES:
+            ilike = timed(lambda: _search_ilike(query, None, 0))
+            fts = timed(lambda: search_users(query, 50, 0))
+            print(f'{query:<12} {ilike[0]:>10.2f} {ilike[1]:>10.2f} {fts[0]:>10.2f} {fts[1]:>10.2f}')
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    for size in SIZES:
+        run(size)
@@ -0,0 +1,53 @@
+"""
+Serialization benchmark for the list endpoints: ORM instances + serialize() + jsonify() vs the
+column projection + json_response() fast path of api/serializers.py. Also checks both produce
+exactly the same bytes:
+    $ python benchmarks/serialization_benchmark.py 1000 10000 100000
+"""
+import sys
+import time
+from common import setup_app, seed_users
+
+SIZES = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+REPEAT = 5
+
+
+def best_time(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def run(size):
+    app = setup_app(f'serialization_benchmark_{size}')
+    from flask import jsonify
+    from api.models import db, User
+    from api.serializers import query_user_rows, serialize_user_rows, json_response
+
+    def orm_path():
+        users = User.query.order_by(User.id).all()
+        body = jsonify({'users': [user.serialize() for user in users]}).get_data()
+        db.session.expunge_all()
+        return body
+
+    def fast_path():
+        rows = query_user_rows().order_by(User.id).all()
+        return json_response({'users': serialize_user_rows(rows)}).get_data()
+
+    with app.app_context():
+        seed_users(size)
+        with app.test_request_context():
+            orm_seconds, orm_body = best_time(orm_path)
+            fast_seconds, fast_body = best_time(fast_path)
+        db.session.remove()
+
+    print(f'{size:>8} {size / orm_seconds:>14,.0f} {size / fast_seconds:>14,.0f} {orm_seconds / fast_seconds:>8.2f}x {str(orm_body == fast_body):>10}')
+
+
+if __name__ == '__main__':
+    print(f'{"users":>8} {"orm rows/s":>14} {"fast rows/s":>14} {"speedup":>9} {"identical":>10}')
+    for size in SIZES:
+        run(size)
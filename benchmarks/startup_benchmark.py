@@ -0,0 +1,81 @@
+"""
+Startup benchmark: time to import src/app.py, to build the app with create_app() and to answer the
+first (cold) and second requests, every run in a fresh interpreter like a new gunicorn worker or an
+autoscaled dyno. Admin on and off are measured separately:
+    $ python benchmarks/startup_benchmark.py --runs 10
+    $ python benchmarks/startup_benchmark.py --runs 10 --json > startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PHASES = ['import', 'create_app', 'first_request', 'second_request']
+VARIANTS = {'admin off': {'ENABLE_ADMIN': '0'}, 'admin on': {'ENABLE_ADMIN': '1'}}
+DATABASE = '/tmp/startup_benchmark.db'
+
+
+def child():
+    # Runs in the fresh interpreter, prints the phase timings as JSON
+    import time
+    start = time.perf_counter()
+    timings = {}
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+    from app import create_app
+    timings['import'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{DATABASE}'})
+    timings['create_app'] = time.perf_counter() - start
+
+    client = app.test_client()
+    for phase in ('first_request', 'second_request'):
+        start = time.perf_counter()
+        response = client.get('/users?limit=20')
+        timings[phase] = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+    print(json.dumps(timings))
+
+
+def prepare_database():
+    from common import setup_app, seed_users
+    os.environ['BENCH_DATABASE_URL'] = f'sqlite:///{DATABASE}'
+    app = setup_app('startup_benchmark')
+    with app.app_context():
+        seed_users(100)
+
+
+def run(variant_env, runs):
+    samples = {phase: [] for phase in PHASES}
+    env = dict(os.environ, **variant_env)
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, __file__, '--child'], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        for phase in PHASES:
+            samples[phase].append(timings[phase] * 1000)
+    return {phase: round(statistics.median(values), 1) for phase, values in samples.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print the medians as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit()
+
+    prepare_database()
+    results = {name: run(variant_env, args.runs) for name, variant_env in VARIANTS.items()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f'median of {args.runs} runs, milliseconds')
+        print(f'{"variant":<10} ' + ' '.join(f'{phase:>15}' for phase in PHASES))
+        for name, medians in results.items():
+            print(f'{name:<10} ' + ' '.join(f'{medians[phase]:>15}' for phase in PHASES))
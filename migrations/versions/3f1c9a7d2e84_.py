@@ -0,0 +1,41 @@
+"""add review aggregates to user
+
+Revision ID: 3f1c9a7d2e84
+Revises: b228cf02171f
+Create Date: 2024-10-14 10:12:41.508211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2e84'
+down_revision = 'b228cf02171f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('score_sum', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the aggregates from the existing reviews
+    op.execute("""
+        UPDATE "user" SET
+            review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.reviewee_id = "user".id),
+            score_sum = (SELECT COALESCE(SUM(score), 0) FROM reviews WHERE reviews.reviewee_id = "user".id)
+    """)
+    op.execute("""
+        UPDATE "user" SET average_score = CASE
+            WHEN review_count > 0 THEN CAST(score_sum AS FLOAT) / review_count
+            ELSE 3
+        END
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('score_sum')
+        batch_op.drop_column('review_count')
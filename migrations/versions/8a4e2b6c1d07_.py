@@ -0,0 +1,31 @@
+"""best sharers leaderboard index
+
+Revision ID: 8a4e2b6c1d07
+Revises: 3f1c9a7d2e84
+Create Date: 2024-10-15 17:40:03.118524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e2b6c1d07'
+down_revision = '3f1c9a7d2e84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_best_sharers_rank', 'best_sharers', [sa.text('media_average DESC'), 'id'], unique=False)
+
+    # Fill the leaderboard with every existing user
+    op.execute('DELETE FROM best_sharers')
+    op.execute("""
+        INSERT INTO best_sharers (id, media_average)
+        SELECT id, COALESCE(average_score, 3) FROM "user"
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_best_sharers_rank', table_name='best_sharers')
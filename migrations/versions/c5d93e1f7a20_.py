@@ -0,0 +1,75 @@
+"""user full-text search index
+
+Revision ID: c5d93e1f7a20
+Revises: 8a4e2b6c1d07
+Create Date: 2024-10-16 11:05:52.730164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d93e1f7a20'
+down_revision = '8a4e2b6c1d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("""
+            ALTER TABLE "user" ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(last_name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(location, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(language, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+            ) STORED
+        """)
+        op.execute('CREATE INDEX ix_user_search_vector ON "user" USING GIN (search_vector)')
+
+    elif dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE user_fts USING fts5(
+                name, last_name, location, language, description,
+                content='user', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER user_fts_insert AFTER INSERT ON user BEGIN
+                INSERT INTO user_fts(rowid, name, last_name, location, language, description)
+                VALUES (new.id, new.name, new.last_name, new.location, new.language, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER user_fts_delete AFTER DELETE ON user BEGIN
+                INSERT INTO user_fts(user_fts, rowid, name, last_name, location, language, description)
+                VALUES ('delete', old.id, old.name, old.last_name, old.location, old.language, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER user_fts_update AFTER UPDATE OF name, last_name, location, language, description ON user BEGIN
+                INSERT INTO user_fts(user_fts, rowid, name, last_name, location, language, description)
+                VALUES ('delete', old.id, old.name, old.last_name, old.location, old.language, old.description);
+                INSERT INTO user_fts(rowid, name, last_name, location, language, description)
+                VALUES (new.id, new.name, new.last_name, new.location, new.language, new.description);
+            END
+        """)
+        op.execute("INSERT INTO user_fts(user_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_user_search_vector')
+        op.execute('ALTER TABLE "user" DROP COLUMN IF EXISTS search_vector')
+
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS user_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS user_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS user_fts_insert')
+        op.execute('DROP TABLE IF EXISTS user_fts')
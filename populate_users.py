@@ -1,78 +1,179 @@
-import requests
+"""
+Populates the API with users through its public endpoints, concurrently.
+
+Every virtual user signs up, logs in and fills its profile, and can optionally add skills, review
+other generated users and send them match requests. A live line shows throughput and errors, so it
+also works as an end to end soak test:
+
+    $ python populate_users.py --base-url http://localhost:3001 --users 10000 --concurrency 50 --skills 2 --reviews 1 --matches 1
+"""
+import argparse
+import asyncio
+import os
 import random
 import string
+import sys
+import time
+from collections import Counter
+import aiohttp
+
+PASSWORD = 'Password1234'
+SKILLS = ['Cooking', 'Sports', 'Music', 'Languages', 'Art', 'Others']
+LOCATIONS = ['Madrid', 'Barcelona', 'Sevilla', 'Valencia', 'Bilbao']
 
-BASE_URL = 'https://obscure-orbit-wp66v45p7rrcq5q-3001.app.github.dev'
-NUMBER_OF_USERS = 10  
-PASSWORD = 'Password1234'  
 
 def generate_random_email():
-    username = ''.join(random.choices(string.ascii_lowercase, k=8))
+    username = ''.join(random.choices(string.ascii_lowercase, k=12))
     domain = random.choice(['email.com', 'test.com', 'example.com'])
     return f'{username}@{domain}'
 
+
 def generate_random_name():
     return ''.join(random.choices(string.ascii_letters, k=7)).capitalize()
 
-def register_user(email, password):
-    signup_url = f'{BASE_URL}/signup'
-    signup_payload = {
-        "email": email,
-        "password": password
-    }
-    response = requests.post(signup_url, json=signup_payload)
-    
-    if response.status_code == 201:
-        print(f"Usuario {email} creado exitosamente.")
-        return True
-    else:
-        print(f"Error al crear el usuario {email}: {response.json()}")
-        return False
-
-def login_user(email, password):
-    login_url = f'{BASE_URL}/login'
-    login_payload = {
-        "email": email,
-        "password": password
-    }
-    response = requests.post(login_url, json=login_payload)
-    
-    if response.status_code == 200:
-        token = response.json()['access_token']
-        print(f"Login exitoso para {email}.")
-        return token
-    else:
-        print(f"Error en el login para {email}: {response.json()}")
-        return None
-
-def update_user_profile(token):
-    update_url = f'{BASE_URL}/update_user'
-    headers = {
-        'Authorization': f'Bearer {token}'
-    }
-    update_payload = {
-        "name": generate_random_name(),
-        "last_name": generate_random_name(),
-        "phone": f'+{random.randint(100000000, 999999999)}',
-        "location": random.choice(['Madrid', 'Barcelona', 'Sevilla', 'Valencia', 'Bilbao']),
-        "gender": random.choice(['Male', 'Female', 'Other']),
-        "description": "Este es un ejemplo de descripción."
-    }
-    response = requests.put(update_url, json=update_payload, headers=headers)
-    
-    if response.status_code == 200:
-        print(f"Perfil del usuario actualizado correctamente.")
-    else:
-        print(f"Error al actualizar el perfil: {response.json()}")
-
-def main():
-    for i in range(NUMBER_OF_USERS):
+
+class Stats:
+    def __init__(self, total):
+        self.total = total
+        self.users_done = 0
+        self.ok = Counter()
+        self.errors = Counter()
+        self.start = time.perf_counter()
+
+    def record(self, action, ok, detail=None):
+        if ok:
+            self.ok[action] += 1
+        else:
+            self.errors[f'{action} {detail}'] += 1
+
+    def line(self):
+        elapsed = time.perf_counter() - self.start
+        requests = sum(self.ok.values()) + sum(self.errors.values())
+        return (f'users {self.users_done}/{self.total} | {requests} requests | '
+                f'{requests / elapsed:.1f} req/s | {self.users_done / elapsed:.1f} users/s | '
+                f'errors {sum(self.errors.values())}')
+
+
+class Populator:
+    def __init__(self, session, base_url, args, stats):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.args = args
+        self.stats = stats
+        self.created = []  # user ids other users can review or match with
+
+    async def call(self, action, method, path, payload=None, token=None, ok_status=(200, 201)):
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        try:
+            async with self.session.request(method, f'{self.base_url}{path}', json=payload, headers=headers) as response:
+                body = await response.json(content_type=None)
+                ok = response.status in ok_status
+                self.stats.record(action, ok, response.status)
+                if not ok and self.args.verbose:
+                    print(f'\n{action} {response.status}: {body}')
+                return body if ok else None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.stats.record(action, False, type(e).__name__)
+            return None
+
+    async def register_user(self, email, password):
+        body = await self.call('signup', 'POST', '/signup', {'email': email, 'password': password})
+        return body['user_id'] if body else None
+
+    async def login_user(self, email, password):
+        body = await self.call('login', 'POST', '/login', {'email': email, 'password': password})
+        return body['access_token'] if body else None
+
+    async def update_user_profile(self, token):
+        return await self.call('update_user', 'PUT', '/update_user', {
+            "name": generate_random_name(),
+            "last_name": generate_random_name(),
+            "phone": f'+{random.randint(100000000, 999999999)}',
+            "location": random.choice(LOCATIONS),
+            "gender": random.choice(['Male', 'Female', 'Other']),
+            "description": "Este es un ejemplo de descripción."
+        }, token=token)
+
+    async def add_skills(self, token):
+        for skill in random.sample(SKILLS, min(self.args.skills, len(SKILLS))):
+            await self.call('add_skill', 'POST', '/add/skill', {'skill': skill, 'description': f'I can teach {skill}'}, token=token)
+
+    async def post_reviews(self, token, user_id):
+        for reviewee_id in self.pick_others(user_id, self.args.reviews):
+            await self.call('add_review', 'POST', '/add/review', {
+                'reviewee_id': reviewee_id, 'score': random.randint(1, 5), 'comment': 'Generated review'
+            }, token=token)
+
+    async def send_matches(self, token, user_id):
+        for match_to_id in self.pick_others(user_id, self.args.matches):
+            await self.call('match', 'POST', '/match', {'match_to_id': match_to_id}, token=token)
+
+    def pick_others(self, user_id, count):
+        others = [other for other in random.sample(self.created, min(count + 1, len(self.created))) if other != user_id]
+        return others[:count]
+
+    async def populate_one(self):
         email = generate_random_email()
-        
-        if register_user(email, PASSWORD):
-            token = login_user(email, PASSWORD)
+        user_id = await self.register_user(email, self.args.password)
+        if user_id:
+            token = await self.login_user(email, self.args.password)
             if token:
-                update_user_profile(token)
+                await self.update_user_profile(token)
+                if self.args.skills:
+                    await self.add_skills(token)
+                if self.args.reviews:
+                    await self.post_reviews(token, user_id)
+                if self.args.matches:
+                    await self.send_matches(token, user_id)
+            self.created.append(user_id)
+        self.stats.users_done += 1
+
+
+async def report(stats, interval):
+    while True:
+        await asyncio.sleep(interval)
+        sys.stdout.write('\r' + stats.line())
+        sys.stdout.flush()
+
+
+async def main(args):
+    stats = Stats(args.users)
+    # One connection pool for every request, sized to the concurrency
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        populator = Populator(session, args.base_url, args, stats)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited():
+            async with semaphore:
+                await populator.populate_one()
+
+        reporter = asyncio.create_task(report(stats, 1))
+        await asyncio.gather(*(limited() for _ in range(args.users)))
+        reporter.cancel()
+
+    print('\r' + stats.line())
+    for action, count in sorted(stats.ok.items()):
+        print(f'  ok     {action:<20} {count}')
+    for action, count in sorted(stats.errors.items()):
+        print(f'  error  {action:<20} {count}')
+    return 1 if stats.errors else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default=os.getenv('POPULATE_BASE_URL', os.getenv('BACKEND_URL', 'http://localhost:3001')))
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--skills', type=int, default=0, help='skills added by every user')
+    parser.add_argument('--reviews', type=int, default=0, help='reviews posted by every user')
+    parser.add_argument('--matches', type=int, default=0, help='match requests sent by every user')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds per request')
+    parser.add_argument('--verbose', action='store_true', help='print every failed response')
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(asyncio.run(main(parse_args())))
@@ -6,5 +6,6 @@ npm install
 npm run build
 
 pipenv install
+pipenv run compress-static
 
 pipenv run upgrade
@@ -1,7 +1,7 @@
   
 import os
 from flask_admin import Admin
-from .models import db, User,Favorite,Categories,Review,BestSharers,Match,TokenRestorePassword
+from .models import db, User,Favorite,Categories,Review,BestSharers,Match,TokenRestorePassword,EmailOutbox
 from flask_admin.contrib.sqla import ModelView
 
 def setup_admin(app):
@@ -18,6 +18,7 @@ def setup_admin(app):
     admin.add_view(ModelView(BestSharers, db.session))
     admin.add_view(ModelView(Match, db.session))
     admin.add_view(ModelView(TokenRestorePassword, db.session))
+    admin.add_view(ModelView(EmailOutbox, db.session))
 
     # You can duplicate that line to add mew models
     # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
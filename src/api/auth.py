@@ -0,0 +1,124 @@
+"""
+Current user loader for the @jwt_required endpoints.
+
+flask_jwt_extended calls load_user() once per request (current_user / get_current_user() reuse the
+result) and the loaded users are kept in a small per-process LRU cache with a TTL, so most
+authenticated requests don't query the user at all. Tokens of deleted or deactivated users get a 401.
+
+The cache holds plain AuthUser tuples, never ORM instances. On a cache miss the ORM row the tuple
+comes from stays on g for the rest of the request, current_user_row() gives it to the handlers that
+read or change the whole user, so the row is never selected twice in a request. Updating or deleting a User through the
+ORM drops its entry when the transaction commits; other worker processes see the change within
+AUTH_CACHE_TTL seconds.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from flask import g, has_request_context, jsonify
+from flask_jwt_extended import current_user
+from sqlalchemy import event
+from api.models import db, User
+from api.db_routing import primary_reads
+from api.session_hooks import on_commit, pending
+
+AuthUser = namedtuple('AuthUser', ['id', 'email', 'is_active'])
+
+PENDING_KEY = 'auth_cache_invalidate'
+
+
+class UserCache:
+    def __init__(self, size=1024, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user id -> (expires_at, AuthUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user):
+        if not self.size:
+            return
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is None:
+        # Never from the replica: a user created or reactivated moments ago must not get a 401
+        with primary_reads():
+            row = User.query.get(user_id)
+        if row is None:
+            return None
+        if has_request_context():
+            g.current_user_row = row
+        user = AuthUser(row.id, row.email, row.is_active)
+        user_cache.set(user)
+    return user if user.is_active else None
+
+
+def current_user_row():
+    """The User instance of the @jwt_required request, the one load_user() read or a single lookup."""
+    row = g.get('current_user_row')
+    if row is None:
+        with primary_reads():
+            row = g.current_user_row = User.query.get(current_user.id)
+    return row
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    pending(target, PENDING_KEY).add(target.id)
+
+
+def _invalidate_committed(user_ids):
+    # Only after the commit, so a concurrent request can't cache the old row again
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+
+
+on_commit(PENDING_KEY, set, _invalidate_committed)
+
+
+def setup_current_user(app, jwt):
+    user_cache.size = app.config.setdefault('AUTH_CACHE_SIZE', int(os.getenv('AUTH_CACHE_SIZE', 1024)))
+    user_cache.ttl = app.config.setdefault('AUTH_CACHE_TTL', int(os.getenv('AUTH_CACHE_TTL', 60)))
+
+    @jwt.user_lookup_loader
+    def user_lookup(jwt_header, jwt_data):
+        # Same key whether the library gives the identity back as an int or a string
+        try:
+            user_id = int(jwt_data[app.config.get('JWT_IDENTITY_CLAIM', 'sub')])
+        except (TypeError, ValueError):
+            return None
+        return load_user(user_id)
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error(jwt_header, jwt_data):
+        return jsonify({'msg': 'User not found or inactive'}), 401
@@ -0,0 +1,223 @@
+"""
+In-memory prefix index behind GET /autocomplete (names, last names, locations and languages).
+
+Every field is a sorted list of folded terms (lowercase, without accents) with the text to show and
+the number of active users using it: the terms starting with a prefix are one bisect range of the
+list. Ranges wider than SCAN_LIMIT (the one or two letter prefixes) keep their top terms in a small
+memo, so a lookup never walks more than SCAN_LIMIT terms. Multi-word values are also indexed by
+every later word ("Maria Jose" is found with "jo"), and languages are split on commas.
+
+The index is built when the gunicorn worker starts (gunicorn.conf.py), or by the first lookup, and
+holds at most AUTOCOMPLETE_MAX_TERMS terms per field, the most used ones. Committed ORM changes to
+users (create_user, update_user, the admin) are applied in place. Every AUTOCOMPLETE_RELOAD_SECONDS
+a background thread reloads it to pick up the changes made by other workers (a change committed
+by this worker during the reload can be missed until the next one). Its size in terms and
+bytes and the lookup latency are exported at /metrics.
+"""
+import os
+import re
+import sys
+import time
+import bisect
+import heapq
+import logging
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from api.models import db, User
+from api.session_hooks import on_commit, pending
+from api.metrics import AUTOCOMPLETE_LATENCY
+
+FIELDS = ['name', 'last_name', 'location', 'language']
+SCAN_LIMIT = 256
+MAX_PREFIX = 50
+
+PENDING_KEY = 'autocomplete_pending'
+
+logger = logging.getLogger(__name__)
+
+
+def fold(text):
+    # Same matching as the full-text search: case and accents don't matter
+    decomposed = unicodedata.normalize('NFKD', text.strip().lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def terms(field, value):
+    """(folded key, text to show) of every term a field value is found by."""
+    if not value:
+        return []
+    if field == 'language':
+        parts = [part.strip() for part in re.split(r'[,;/]', value)]
+    else:
+        words = value.split()
+        # The whole value, then every later word on its own
+        parts = [' '.join(words)] + words[1:]
+    return [(fold(part), part) for part in parts if part]
+
+
+class PrefixIndex:
+    """The terms of one field, sorted by key, with parallel labels and user counts."""
+
+    def __init__(self, counts, max_terms):
+        # counts: {key: Counter of the texts seen for it}
+        self.max_terms = max_terms
+        kept = heapq.nlargest(max_terms, counts.items(), key=lambda item: sum(item[1].values())) if len(counts) > max_terms else counts.items()
+        kept = sorted(kept)
+        self.keys = [key for key, _ in kept]
+        # The most used spelling of every key
+        self.labels = [texts.most_common(1)[0][0] for _, texts in kept]
+        self.counts = array('I', [sum(texts.values()) for _, texts in kept])
+        self._top = {}  # prefix -> [(count, position)], for the ranges wider than SCAN_LIMIT
+
+    def lookup(self, prefix, limit):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+        if end - start > SCAN_LIMIT:
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._top[prefix] = self._best(start, end, SCAN_LIMIT)
+        else:
+            top = self._best(start, end, limit)
+        return [(self.labels[position], count) for count, position in top[:limit]]
+
+    def _best(self, start, end, limit):
+        counts = self.counts
+        best = heapq.nsmallest(limit, (position for position in range(start, end) if counts[position]),
+                               key=lambda position: (-counts[position], position))
+        return [(counts[position], position) for position in best]
+
+    def add(self, key, label, delta):
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self.counts[position] = max(self.counts[position] + delta, 0)
+        elif delta > 0 and len(self.keys) < self.max_terms:
+            self.keys.insert(position, key)
+            self.labels.insert(position, label)
+            self.counts.insert(position, delta)
+        else:
+            # A term left out by the bound, the next reload decides if it gets in
+            return
+        for length in range(1, len(key) + 1):
+            self._top.pop(key[:length], None)
+
+    def memory(self):
+        """Approximate bytes held by the lists, the strings and the counts."""
+        return (sys.getsizeof(self.keys) + sys.getsizeof(self.labels) + sum(map(sys.getsizeof, self.keys))
+                + sum(sys.getsizeof(label) for label, key in zip(self.labels, self.keys) if label is not key)
+                + self.counts.itemsize * len(self.counts))
+
+
+class Autocomplete:
+    def __init__(self, app=None):
+        self.indexes = None
+        self.loaded_at = None
+        self.max_terms = 50000
+        self.reload_seconds = 600
+        self._reloading = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_terms = app.config.setdefault('AUTOCOMPLETE_MAX_TERMS', int(os.getenv('AUTOCOMPLETE_MAX_TERMS', 50000)))
+        self.reload_seconds = app.config.setdefault('AUTOCOMPLETE_RELOAD_SECONDS', int(os.getenv('AUTOCOMPLETE_RELOAD_SECONDS', 600)))
+        app.extensions['autocomplete'] = self
+
+    def build(self):
+        """Index every active user, one query."""
+        counts = {field: defaultdict(Counter) for field in FIELDS}
+        rows = db.session.connection().execute(
+            db.select(*[getattr(User, field) for field in FIELDS]).where(User.is_active.is_(True))
+        )
+        for row in rows:
+            for field, value in zip(FIELDS, row):
+                for key, label in terms(field, value):
+                    counts[field][key][label] += 1
+        indexes = {field: PrefixIndex(counts[field], self.max_terms) for field in FIELDS}
+        with self._lock:
+            self.indexes = indexes
+            self.loaded_at = time.monotonic()
+
+    def lookup(self, prefix, limit, fields=FIELDS):
+        """{field: [(text, users)]} of the most used terms starting with prefix."""
+        if self.indexes is None:
+            self.build()
+        elif time.monotonic() - self.loaded_at > self.reload_seconds and not self._reloading:
+            self._reloading = True
+            threading.Thread(target=self._reload, args=(current_app._get_current_object(),), daemon=True).start()
+
+        start = time.perf_counter()
+        key = fold(prefix)[:MAX_PREFIX]
+        with self._lock:
+            results = {field: self.indexes[field].lookup(key, limit) for field in fields}
+        AUTOCOMPLETE_LATENCY.observe(time.perf_counter() - start)
+        return results
+
+    def _reload(self, app):
+        with app.app_context():
+            try:
+                self.build()
+            except Exception:
+                logger.exception('autocomplete reload failed')
+                # Next try after another period
+                self.loaded_at = time.monotonic()
+            finally:
+                db.session.remove()
+                self._reloading = False
+
+    def apply(self, changes):
+        if self.indexes is None:
+            return
+        with self._lock:
+            for (field, key, label), delta in changes.items():
+                if delta:
+                    self.indexes[field].add(key, label, delta)
+
+    def metrics(self):
+        with self._lock:
+            indexes = self.indexes or {}
+            return {field: (len(index.keys), index.memory()) for field, index in indexes.items()}
+
+
+def _user_terms(target, before):
+    # Values before or after the flush, from the attribute history, None for an inactive user
+    state = inspect(target)
+    values = {}
+    for attribute in ('is_active', *FIELDS):
+        history = state.attrs[attribute].history
+        changed = history.deleted if before else history.added
+        values[attribute] = changed[0] if changed else (history.unchanged[0] if history.unchanged else None)
+    if values['is_active'] is False:
+        return Counter()
+    return Counter((field, key, label) for field in FIELDS for key, label in terms(field, values[field]))
+
+
+@event.listens_for(User, 'after_insert')
+def _user_created(mapper, connection, target):
+    pending(target, PENDING_KEY).update(_user_terms(target, before=False))
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    changes = pending(target, PENDING_KEY)
+    changes.update(_user_terms(target, before=False))
+    changes.subtract(_user_terms(target, before=True))
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    pending(target, PENDING_KEY).subtract(_user_terms(target, before=True))
+
+
+def _apply_committed(changes):
+    if changes and has_app_context():
+        autocomplete = current_app.extensions.get('autocomplete')
+        if autocomplete is not None:
+            autocomplete.apply(changes)
+
+
+on_commit(PENDING_KEY, Counter, _apply_committed)
@@ -1,6 +1,10 @@
 
 import click
-from api.models import db, User
+from api.models import db, User, update_best_sharers, rebuild_connections, rebuild_review_aggregates
+from api.query_plans import check_query_plans, check_profile_query_count, PROFILE_FULL_QUERY_BUDGET
+from api.generator import generate_test_data
+from api.static_files import compress_directory
+from api.outbox import get_mail, send_pending, run_sender, BATCH_SIZE, POLL_INTERVAL
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
@@ -12,23 +16,153 @@ def setup_commands(app):
     """ 
     This is an example command "insert-test-users" that you can run from the command line
     by typing: $ flask insert-test-users 5
-    Note: 5 is the number of users to add
+    Note: 5 is the number of users to add, without reviews, skills or matches
     """
     @app.cli.command("insert-test-users") # name of our command
     @click.argument("count") # argument of out command
-    def insert_test_users(count):
+    @click.option("--seed", default=42, show_default=True)
+    def insert_test_users(count, seed):
         print("Creating test users")
-        for x in range(1, int(count) + 1):
-            user = User()
-            user.email = "test_user" + str(x) + "@test.com"
-            user.password = "123456"
-            user.is_active = True
-            db.session.add(user)
-            db.session.commit()
-            print("User: ", user.email, " created.")
-
+        for progress in generate_test_data(int(count), seed=seed, relations=False):
+            print(progress)
         print("All test users created")
 
+    """
+    Generates a full synthetic dataset: users, skills, reviews, matches in every status,
+    favorites and the best sharers leaderboard. Same seed, same data:
+    $ flask insert-test-data --users 1000000 --seed 42
+    """
     @app.cli.command("insert-test-data")
-    def insert_test_data():
-        pass
\ No newline at end of file
+    @click.option("--users", default=1000, show_default=True)
+    @click.option("--seed", default=42, show_default=True)
+    @click.option("--chunk-size", default=10000, show_default=True)
+    @click.option("--password", default="Password1234", show_default=True, help="Shared by every generated user")
+    def insert_test_data(users, seed, chunk_size, password):
+        print("Generating test data")
+        for progress in generate_test_data(users, seed=seed, chunk_size=chunk_size, password=password):
+            print(progress)
+        print("All test data created")
+
+    """
+    Rebuilds the review_count, score_sum and average_score columns of every user
+    from the reviews table, in batches: $ flask rebuild-review-aggregates --batch-size 1000
+    """
+    @app.cli.command("rebuild-review-aggregates")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def rebuild_review_aggregates_command(batch_size):
+        print("Rebuilding review aggregates")
+        last_id = 0
+        total = 0
+        while True:
+            user_ids = [row.id for row in db.session.query(User.id)
+                        .filter(User.id > last_id)
+                        .order_by(User.id)
+                        .limit(batch_size)]
+            if not user_ids:
+                break
+
+            rebuild_review_aggregates(user_ids)
+            db.session.commit()
+
+            last_id = user_ids[-1]
+            total += len(user_ids)
+            print("Users processed: ", total)
+
+        print("All review aggregates rebuilt")
+
+    """
+    Rebuilds the best_sharers leaderboard from the users average_score: $ flask refresh-best-sharers
+    """
+    @app.cli.command("refresh-best-sharers")
+    def refresh_best_sharers():
+        print("Refreshing best sharers")
+        update_best_sharers()
+        print("Best sharers refreshed")
+
+    """
+    Rebuilds the connections table (both directions of every accepted match) from the matches,
+    in batches of users: $ flask rebuild-connections --batch-size 10000
+    """
+    @app.cli.command("rebuild-connections")
+    @click.option("--batch-size", default=10000, show_default=True)
+    def rebuild_connections_command(batch_size):
+        print("Rebuilding connections")
+        last_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        for start in range(1, last_id + 1, batch_size):
+            end = min(start + batch_size - 1, last_id)
+            rebuild_connections(start, end)
+            db.session.commit()
+            print("Users processed: ", end)
+        print("All connections rebuilt")
+
+    """
+    Runs EXPLAIN for the hot path queries of the API and fails if any of them does a
+    sequential scan, run it against a seeded database: $ flask check-query-plans
+    """
+    @app.cli.command("check-query-plans")
+    @click.option("--verbose", is_flag=True, help="Print the full plan of every query")
+    def check_plans(verbose):
+        failures = 0
+        for name, (plan, scans) in check_query_plans().items():
+            print(("SEQ SCAN " + ", ".join(scans) if scans else "ok").ljust(24), name)
+            if verbose or scans:
+                for line in plan:
+                    print("    ", line)
+            failures += bool(scans)
+
+        if failures:
+            raise click.ClickException(f"{failures} hot path queries use a sequential scan")
+        print("All hot path queries use an index")
+
+    """
+    Counts the SQL statements of GET /profile/<id>/full for the users with the most and the
+    fewest reviews, fails if they differ or go over the budget (an N+1 is back), run it against
+    a seeded database: $ flask check-query-counts
+    """
+    @app.cli.command("check-query-counts")
+    @click.option("--verbose", is_flag=True, help="Print the statements of every request")
+    def check_query_counts(verbose):
+        results = check_profile_query_count()
+        if results is None:
+            raise click.ClickException("Every user has the same number of reviews, seed the database first: flask insert-test-data")
+
+        counts = set()
+        for user_id, (review_count, statements) in results.items():
+            print(f"{len(statements)} queries".ljust(24), f"/profile/{user_id}/full ({review_count} reviews)")
+            if verbose:
+                for statement in statements:
+                    print("    ", " ".join(statement.split()))
+            counts.add(len(statements))
+
+        if len(counts) > 1:
+            raise click.ClickException("The number of queries of /profile/<id>/full depends on the number of reviews")
+        if max(counts) > PROFILE_FULL_QUERY_BUDGET:
+            raise click.ClickException(f"/profile/<id>/full runs more than {PROFILE_FULL_QUERY_BUDGET} queries")
+        print("/profile/<id>/full is within its query budget")
+
+    """
+    Sends the queued emails of the outbox. Runs forever polling the table, or only
+    one batch with --once: $ flask send-outbox
+    """
+    @app.cli.command("send-outbox")
+    @click.option("--once", is_flag=True, help="Send a single batch and exit")
+    @click.option("--batch-size", default=BATCH_SIZE, show_default=True)
+    @click.option("--interval", default=POLL_INTERVAL, show_default=True)
+    def send_outbox(once, batch_size, interval):
+        mail = get_mail(app)
+        if once:
+            print("Emails sent: ", send_pending(mail, batch_size))
+            return
+        print("Sending outbox emails, press Ctrl+C to stop")
+        run_sender(app, mail, interval, batch_size)
+
+    """
+    Writes .gz / .br versions of the built front end files, served to the browsers that accept
+    them. Run it after every build: $ npm run build && flask compress-static
+    """
+    @app.cli.command("compress-static")
+    def compress_static():
+        static_assets = app.extensions['static_assets']
+        for name in compress_directory(static_assets.directory):
+            print("Compressed", name)
+        static_assets.scan()
@@ -0,0 +1,60 @@
+"""
+Negotiated gzip / brotli compression of the API responses.
+
+Text responses (JSON, HTML, plain text) larger than COMPRESS_MIN_SIZE bytes are compressed with the
+best encoding the client accepts: brotli when the package is installed, then gzip. Streamed
+responses and files that already have an encoding (api/static_files.py) are left alone. Compressing
+changes the bytes, so a strong ETag becomes weak; the conditional GETs compare them weakly.
+"""
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always there
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+    return gzip.compress(data, config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def _encoding():
+    encodings = [('br', request.accept_encodings['br'])] if brotli is not None else []
+    encodings.append(('gzip', request.accept_encodings['gzip']))
+    # Highest q-value wins, brotli on ties
+    encoding, quality = max(encodings, key=lambda item: item[1])
+    return encoding if quality else None
+
+
+def setup_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', int(os.getenv('COMPRESS_GZIP_LEVEL', 6)))
+    # Low brotli qualities are as fast as gzip and still smaller, 11 is for static files only
+    app.config.setdefault('COMPRESS_BR_QUALITY', int(os.getenv('COMPRESS_BR_QUALITY', 4)))
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = _encoding()
+        if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(_compress(data, encoding, app.config))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,68 @@
+"""
+Queries over the connection graph (the connections table, both directions of every accepted match).
+
+Every lookup starts from the (user_id, friend_id) primary key: the connections of a user are one
+index range already sorted by friend_id, so the lists are keyset paginated on friend_id and the
+mutual connections of two users are the intersection of two sorted ranges (a merge join). The
+suggestions are the friends of friends, ranked by the number of mutual connections.
+"""
+from sqlalchemy.orm import aliased
+from api.models import db, User, Connection
+from api.serializers import query_user_rows
+
+
+def connection_rows(user_id, after_id, limit, fields=None):
+    """One page of the connections of a user, limit + 1 rows of query_user_rows()."""
+    return connection_query(user_id, after_id, limit, fields).all()
+
+
+def connection_query(user_id, after_id, limit, fields=None):
+    return query_user_rows(fields=fields).join(Connection, Connection.friend_id == User.id).filter(
+        Connection.user_id == user_id, Connection.friend_id > after_id
+    ).order_by(Connection.friend_id).limit(limit + 1)
+
+
+def connection_count(user_id):
+    return db.session.query(db.func.count()).filter(Connection.user_id == user_id).scalar()
+
+
+def mutual_rows(user_id, other_id, after_id, limit, fields=None):
+    """One page of the users connected to both, limit + 1 rows of query_user_rows()."""
+    return mutual_query(user_id, other_id, after_id, limit, fields).all()
+
+
+def mutual_query(user_id, other_id, after_id, limit, fields=None):
+    mine = aliased(Connection)
+    theirs = aliased(Connection)
+    return query_user_rows(fields=fields).select_from(mine).join(theirs, theirs.friend_id == mine.friend_id).join(
+        User, User.id == mine.friend_id
+    ).filter(
+        mine.user_id == user_id, theirs.user_id == other_id, mine.friend_id > after_id
+    ).order_by(mine.friend_id).limit(limit + 1)
+
+
+def mutual_count(user_id, other_id):
+    mine = aliased(Connection)
+    theirs = aliased(Connection)
+    return db.session.query(db.func.count()).select_from(mine).join(theirs, theirs.friend_id == mine.friend_id).filter(
+        mine.user_id == user_id, theirs.user_id == other_id
+    ).scalar()
+
+
+def suggestion_rows(user_id, limit, fields=None):
+    """Friends of friends not connected yet, rows of query_user_rows() plus their mutual connections count."""
+    return suggestion_query(user_id, limit, fields).all()
+
+
+def suggestion_query(user_id, limit, fields=None):
+    friends = db.session.query(Connection.friend_id).filter(Connection.user_id == user_id)
+    second = aliased(Connection)
+    candidates = db.session.query(
+        second.friend_id.label('suggested_id'), db.func.count().label('mutual')
+    ).filter(
+        second.user_id.in_(friends), second.friend_id != user_id, second.friend_id.notin_(friends)
+    ).group_by(second.friend_id).order_by(db.func.count().desc(), second.friend_id).limit(limit).subquery()
+
+    return query_user_rows(candidates.c.mutual, fields=fields).join(
+        candidates, candidates.c.suggested_id == User.id
+    ).order_by(candidates.c.mutual.desc(), User.id)
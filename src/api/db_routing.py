@@ -0,0 +1,102 @@
+"""
+Read/write routing between the primary database and an optional read replica.
+
+With DATABASE_REPLICA_URL set, GET and HEAD requests read from the replica (the 'replica' bind).
+Everything else stays on the primary:
+- requests with any other method, CLI commands and background threads;
+- endpoints decorated with @read_primary (reads of the caller's own data) and the reads inside
+  a primary_reads() block (the JWT user lookup of every request);
+- the rest of a request once its session has written anything (flush or INSERT/UPDATE/DELETE);
+- for REPLICA_STICKY_SECONDS after a successful write, requests from the same browser, marked with
+  a cookie, so a client reads its own writes while the replica catches up.
+
+Locally the replica can be any copy of the primary, for example two SQLite files:
+    DATABASE_URL=sqlite:////tmp/test.db DATABASE_REPLICA_URL=sqlite:////tmp/replica.db
+"""
+import os
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+PRIMARY_COOKIE = 'db_primary'
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and g.get('db_use_replica'):
+            if self._flushing or isinstance(clause, UpdateBase):
+                # Writing: this request reads from the primary from now on
+                g.db_use_replica = False
+            else:
+                return self._replica_engine()
+        return super().get_bind(mapper, clause)
+
+    def _replica_engine(self):
+        return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=REPLICA_BIND)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_primary(view):
+    """Mark a GET view whose reads must see the caller's latest writes."""
+    view.read_primary = True
+    return view
+
+
+@contextmanager
+def primary_reads():
+    """Run the reads of the block on the primary, whatever the rest of the request reads from."""
+    if not has_request_context():
+        yield
+        return
+    use_replica = g.get('db_use_replica', False)
+    g.db_use_replica = False
+    try:
+        yield
+    finally:
+        g.db_use_replica = use_replica
+
+
+def engine_options(url):
+    # Connection pool tuning, the same for the primary and the replica
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    # SQLite file databases don't use a queue pool, the sizes don't apply
+    if not url.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    return options
+
+
+def setup_read_replica(app):
+    """Register the replica bind and the per-request routing, a no-op without DATABASE_REPLICA_URL."""
+    replica_url = app.config.setdefault('DATABASE_REPLICA_URL', os.getenv('DATABASE_REPLICA_URL'))
+    sticky_seconds = app.config.setdefault('REPLICA_STICKY_SECONDS', int(os.getenv('REPLICA_STICKY_SECONDS', 5)))
+    if not replica_url:
+        return
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = replica_url.replace("postgres://", "postgresql://")
+
+    @app.before_request
+    def route_reads():
+        view = app.view_functions.get(request.endpoint)
+        g.db_use_replica = (
+            request.method in READ_METHODS
+            and not getattr(view, 'read_primary', False)
+            and PRIMARY_COOKIE not in request.cookies
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in READ_METHODS and response.status_code < 400 and sticky_seconds:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
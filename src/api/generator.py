@@ -0,0 +1,150 @@
+"""
+Deterministic synthetic data for development and load testing.
+
+Users are generated in chunks with their reviews decided up front, so every user row (and its
+best_sharers row) is written once with consistent review_count, score_sum and average_score. The
+relations (categories, reviews, matches and favorites) are written in a second pass that replays
+the same per-chunk random streams, once every user exists, and the connections of the accepted matches
+are rebuilt at the end. Rows go in with multi-row INSERTs, or COPY on PostgreSQL.
+"""
+import csv
+import io
+import random
+import bcrypt
+from flask import current_app
+from api.models import db, User, Categories, Review, Match, MatchStatus, Favorite, BestSharers, SkillNameEnum, rebuild_connections
+
+NAMES = ['Maria', 'Mario', 'Lucia', 'Pablo', 'Ana', 'Javier', 'Carmen', 'Hugo', 'Sofia', 'Martin', 'Elena', 'Diego']
+LAST_NAMES = ['Garcia', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez', 'Ruiz', 'Diaz', 'Moreno', 'Alvarez']
+LOCATIONS = ['Madrid', 'Barcelona', 'Sevilla', 'Valencia', 'Bilbao', 'Malaga', 'Zaragoza', 'Granada']
+LANGUAGES = ['Spanish', 'English', 'French', 'Portuguese', 'German', 'Italian']
+GENDERS = ['Male', 'Female', 'Other']
+WORDS = ['cook', 'pasta', 'guitar', 'piano', 'paint', 'football', 'tennis', 'teach', 'learn', 'music', 'art', 'yoga']
+SKILLS = [skill.value for skill in SkillNameEnum]
+STATUSES = [status.value for status in MatchStatus]
+
+MAX_REVIEWS = 8
+MAX_SKILLS = 3
+MAX_MATCHES = 4
+MAX_FAVORITES = 3
+
+
+def _reviews(seed, first_id, last_id, total_first, total_last):
+    # (reviewer, reviewee, score) for the reviewees of a chunk, one review per pair at most
+    rnd = random.Random(f'{seed}:reviews:{first_id}')
+    for reviewee in range(first_id, last_id + 1):
+        count = min(rnd.randint(0, MAX_REVIEWS), total_last - total_first)
+        for reviewer in rnd.sample(range(total_first, total_last + 1), count):
+            if reviewer != reviewee:
+                yield reviewer, reviewee, rnd.randint(1, 5)
+
+
+def _copy(table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([r'\N' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    column_list = ', '.join(columns)
+    cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+
+
+def _insert(model, rows):
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        _copy(model.__table__, rows)
+    else:
+        db.session.execute(model.__table__.insert(), rows)
+
+
+def generate_test_data(users, seed=42, chunk_size=10000, password='Password1234', relations=True):
+    """Insert `users` users (and their relations) and yield progress messages."""
+    # Hashed once with the app work factor, every generated user shares it
+    salt = bcrypt.gensalt(current_app.config.get('BCRYPT_LOG_ROUNDS', 12))
+    pw_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    first = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    last = first + users - 1
+
+    for start in range(first, last + 1, chunk_size):
+        end = min(start + chunk_size - 1, last)
+        aggregates = {}
+        if relations:
+            for _, reviewee, score in _reviews(seed, start, end, first, last):
+                count, total = aggregates.get(reviewee, (0, 0))
+                aggregates[reviewee] = (count + 1, total + score)
+
+        rnd = random.Random(f'{seed}:users:{start}')
+        rows = []
+        for user_id in range(start, end + 1):
+            count, total = aggregates.get(user_id, (0, 0))
+            rows.append({
+                'id': user_id,
+                'email': f'test_user{user_id}@test.com',
+                'password': pw_hash,
+                'is_active': True,
+                'name': rnd.choice(NAMES),
+                'last_name': rnd.choice(LAST_NAMES),
+                'location': rnd.choice(LOCATIONS),
+                'language': rnd.choice(LANGUAGES),
+                'gender': rnd.choice(GENDERS),
+                'profile_pic': None,
+                'description': ' '.join(rnd.choices(WORDS, k=8)),
+                'phone': f'+34{rnd.randint(600000000, 699999999)}',
+                'average_score': total / count if count else 3,
+                'review_count': count,
+                'score_sum': total,
+                'version': 1,
+            })
+        _insert(User, rows)
+        _insert(BestSharers, [{'id': row['id'], 'media_average': row['average_score']} for row in rows])
+        db.session.commit()
+        yield f'Users: {end - first + 1}/{users}'
+
+    if db.engine.dialect.name == 'postgresql':
+        # The ids were given explicitly, move the sequence past them
+        db.session.execute(db.text(
+            'SELECT setval(pg_get_serial_sequence(\'"user"\', \'id\'), (SELECT MAX(id) FROM "user"))'
+        ))
+        db.session.commit()
+
+    if not relations:
+        return
+
+    for start in range(first, last + 1, chunk_size):
+        end = min(start + chunk_size - 1, last)
+        rnd = random.Random(f'{seed}:relations:{start}')
+
+        categories, matches, favorites = [], [], []
+        for user_id in range(start, end + 1):
+            for skill in rnd.sample(SKILLS, rnd.randint(0, MAX_SKILLS)):
+                categories.append({'user_id': user_id, 'skill_name': skill, 'description': f'I can teach {skill.lower()}'})
+            for position, other in enumerate(rnd.sample(range(first, last + 1), min(MAX_MATCHES, users))):
+                if other != user_id:
+                    # Cycle through the statuses so every one of them is present
+                    status = STATUSES[(user_id + position) % len(STATUSES)]
+                    matches.append({'match_from_id': user_id, 'match_to_id': other, 'match_status': status})
+            for other in rnd.sample(range(first, last + 1), min(rnd.randint(0, MAX_FAVORITES), users)):
+                if other != user_id:
+                    favorites.append({'favorite_from_id': user_id, 'favorite_to_id': other})
+
+        reviews = [
+            {'reviewer_id': reviewer, 'reviewee_id': reviewee, 'score': score, 'comment': 'Generated review'}
+            for reviewer, reviewee, score in _reviews(seed, start, end, first, last)
+        ]
+
+        _insert(Categories, categories)
+        _insert(Review, reviews)
+        _insert(Match, matches)
+        _insert(Favorite, favorites)
+        db.session.commit()
+        yield f'Relations: {end - first + 1}/{users}'
+
+    # Once every match exists, a pair can be accepted in both directions across chunks
+    for start in range(first, last + 1, chunk_size):
+        rebuild_connections(start, min(start + chunk_size - 1, last))
+        db.session.commit()
+    yield 'Connections rebuilt'
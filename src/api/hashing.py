@@ -0,0 +1,122 @@
+"""
+Password hashing on a small process pool, so a burst of logins doesn't pin the request workers.
+
+The pool is created lazily in every (forked) worker process. When all the workers and the
+wait queue are busy the call fails fast with HashingUnavailable (503 + Retry-After).
+"""
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from api.utils import APIException
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+class HashingUnavailable(APIException):
+    status_code = 503
+
+    def __init__(self, retry_after):
+        APIException.__init__(self, 'Server busy, try again later', payload={'msg': 'Server busy, try again later'})
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool_size = 2
+        self.queue_size = 8
+        self.timeout = 30
+        self.retry_after = 1
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'hash': self._new_stats(), 'check': self._new_stats()}
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # BCRYPT_POOL_SIZE=0 hashes inline in the request thread
+        self.rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', int(os.getenv('BCRYPT_LOG_ROUNDS', 12)))
+        self.pool_size = app.config.setdefault('BCRYPT_POOL_SIZE', int(os.getenv('BCRYPT_POOL_SIZE', os.cpu_count() or 2)))
+        self.queue_size = app.config.setdefault('BCRYPT_QUEUE_SIZE', int(os.getenv('BCRYPT_QUEUE_SIZE', 4 * self.pool_size)))
+        self.timeout = app.config.setdefault('BCRYPT_TIMEOUT', 30)
+        self.retry_after = app.config.setdefault('BCRYPT_RETRY_AFTER', 1)
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.queue_size)
+        app.extensions['password_hasher'] = self
+
+    def generate_password_hash(self, password):
+        return self._run('hash', _hash, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run('check', _check, pw_hash, password)
+
+    def _get_executor(self):
+        # One pool per process, gunicorn forks the workers after the app is imported
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, kind, func, *args):
+        if not self.pool_size:
+            start = time.perf_counter()
+            result = func(*args)
+            self._observe(kind, time.perf_counter() - start)
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingUnavailable(self.retry_after)
+
+        start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            return executor.submit(func, *args).result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            self._observe(kind, time.perf_counter() - start)
+
+    @staticmethod
+    def _new_stats():
+        return {'count': 0, 'sum': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)}
+
+    def _observe(self, kind, seconds):
+        with self._lock:
+            stats = self._stats[kind]
+            stats['count'] += 1
+            stats['sum'] += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.pool_size),
+                'rejected': self.rejected,
+                'latency_buckets': LATENCY_BUCKETS,
+                'hash': dict(self._stats['hash'], buckets=list(self._stats['hash']['buckets'])),
+                'check': dict(self._stats['check'], buckets=list(self._stats['check']['buckets'])),
+            }
@@ -0,0 +1,165 @@
+"""
+Structured logging that never blocks a request on stdout.
+
+Records go through a bounded in-memory queue (the request thread only puts them there, dropping them
+if the queue is full) and a background listener thread writes them to stdout as one JSON object per
+line, with the request id, method and path when they come from a request. Extra fields passed with
+logger.info('msg', extra={...}) are added to the JSON.
+
+LOG_LEVEL sets the level (INFO by default) and LOG_DEBUG_SAMPLE_RATE the fraction of DEBUG records
+kept (1 keeps all of them). Every response carries its request id in X-Request-ID, taken from the
+incoming header when the proxy already set one.
+"""
+import os
+import atexit
+import sys
+import json
+import uuid
+import queue
+import random
+import logging
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# LogRecord attributes that are not extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    # Filters run in the thread that logs, so the request context is still there
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class DebugSampler(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            record.sample_rate = self.rate
+            return True
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, the extra fields stay on the record for the JSON
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogListener:
+    def __init__(self, handler, log_queue):
+        self.handler = handler
+        self.queue = log_queue
+        self._listener = None
+
+    def start(self):
+        self._listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        # Writes what is still queued before returning
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+# One listener per process, however many apps create_app() builds (tests, benchmarks)
+_listener = None
+_queue_handler = None
+_sampler = None
+
+
+def _start_listener(queue_size):
+    global _listener, _queue_handler, _sampler
+    log_queue = queue.Queue(maxsize=queue_size)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = LogListener(stream_handler, log_queue)
+    _listener.start()
+    # The listener thread doesn't survive a fork (gunicorn --preload), start a new one in the child
+    os.register_at_fork(after_in_child=_listener.start)
+    atexit.register(_listener.stop)
+
+    _sampler = DebugSampler(1)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(_sampler)
+    _queue_handler.addFilter(RequestContextFilter())
+
+
+def setup_logging(app):
+    """Send every logger through the JSON queue and add request ids to the app.
+
+    The queue and its listener thread are created by the first call, the later ones only
+    update the level and the DEBUG sample rate (LOG_QUEUE_SIZE is the one of the first app).
+    """
+    level = app.config.setdefault('LOG_LEVEL', os.getenv('LOG_LEVEL', 'INFO').upper())
+    sample_rate = app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1)))
+    queue_size = app.config.setdefault('LOG_QUEUE_SIZE', int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+
+    if _listener is None:
+        _start_listener(queue_size)
+    _sampler.rate = sample_rate
+
+    root = logging.getLogger()
+    if _queue_handler not in root.handlers:
+        root.handlers = [_queue_handler]
+    root.setLevel(level)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+    @app.after_request
+    def add_request_id_header(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+    app.extensions['log_listener'] = _listener
+    app.extensions['log_handler'] = _queue_handler
+    return _listener
@@ -0,0 +1,69 @@
+"""
+Queries behind the match inbox (GET /match).
+
+Every match type is read as rows of (match_id, match_from_id, match_to_id, match_status, counterpart_id),
+counterpart_id being the other user of the match. Pages are keyset paginated on match_id. The
+accepted matches are a UNION ALL of the "sent by me" and "sent to me" halves, so each half uses its
+(user, status) index instead of the OR scanning the whole table. A match is never with yourself, so
+the halves can't overlap.
+
+With include_users the counterpart profiles come from the same query, joined on counterpart_id.
+"""
+from sqlalchemy import union_all
+from api.models import db, User, Match, MatchStatus
+from api.serializers import query_user_rows, serialize_user_rows
+
+MATCH_TYPES = ['incoming', 'outgoing', 'accepted']
+
+MATCH_COLUMNS = [Match.match_id, Match.match_from_id, Match.match_to_id, Match.match_status]
+
+
+def match_query(user_id, match_type, after_id):
+    # A select of the match columns plus counterpart_id
+    if match_type == 'incoming':
+        return db.session.query(*MATCH_COLUMNS, Match.match_from_id.label('counterpart_id')).filter(
+            Match.match_to_id == user_id, Match.match_status == MatchStatus.PENDING.value, Match.match_id > after_id
+        ).statement
+    if match_type == 'outgoing':
+        return db.session.query(*MATCH_COLUMNS, Match.match_to_id.label('counterpart_id')).filter(
+            Match.match_from_id == user_id, Match.match_status == MatchStatus.PENDING.value, Match.match_id > after_id
+        ).statement
+    sent = db.session.query(*MATCH_COLUMNS, Match.match_to_id.label('counterpart_id')).filter(
+        Match.match_from_id == user_id, Match.match_status == MatchStatus.ACCEPTED.value, Match.match_id > after_id
+    )
+    received = db.session.query(*MATCH_COLUMNS, Match.match_from_id.label('counterpart_id')).filter(
+        Match.match_to_id == user_id, Match.match_status == MatchStatus.ACCEPTED.value, Match.match_id > after_id
+    )
+    return union_all(sent.statement, received.statement)
+
+
+def match_rows(user_id, match_type, after_id=0, limit=None, include_users=False, fields=None):
+    """
+    One page of matches, limit + 1 rows so the caller knows if there's a next one.
+    With include_users the rows are the query_user_rows() columns of the counterpart followed by the match.
+    """
+    matches = match_query(user_id, match_type, after_id).subquery()
+    if include_users:
+        query = query_user_rows(*matches.c, fields=fields).select_from(matches).join(User, User.id == matches.c.counterpart_id)
+    else:
+        query = db.session.query(*matches.c)
+    query = query.order_by(matches.c.match_id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query.all()
+
+
+def serialize_match_rows(rows, include_users=False, fields=None):
+    matches = [
+        {
+            'match_id': match_id,
+            'match_from_id': match_from_id,
+            'match_to_id': match_to_id,
+            'match_status': match_status
+        }
+        for match_id, match_from_id, match_to_id, match_status, _ in (row[-5:] for row in rows)
+    ]
+    if include_users:
+        for match, user in zip(matches, serialize_user_rows(rows, fields)):
+            match['user'] = user
+    return matches
@@ -0,0 +1,216 @@
+"""
+Request instrumentation, exposed in the Prometheus text format at /metrics.
+
+Every request records its latency and status code, and how many SQL statements it ran and for how
+long (SQLAlchemy cursor events on every engine). Password hashing (api/hashing.py) and SMTP delivery
+(api/outbox.py) are timed as well. The numbers belong to the process that produced them, so with
+several gunicorn workers every scrape sees the worker that answered it.
+
+METRICS_QUERY_BUDGET > 0 turns on the N+1 detector: requests running more SQL statements than the
+budget are logged with their most repeated statements.
+"""
+import os
+import time
+import threading
+from collections import Counter as StatementCounter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+MICROSECOND_BUCKETS = [0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.01]
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, pairs, buckets, cumulative_counts, count, total):
+    # cumulative_counts[i] holds the observations <= buckets[i]
+    lines = [
+        f'{name}_bucket{_labels(pairs + [("le", _number(float(bound)))])} {bucket_count}'
+        for bound, bucket_count in zip(buckets, cumulative_counts)
+    ]
+    lines.append(f'{name}_bucket{_labels(pairs + [("le", "+Inf")])} {count}')
+    lines.append(f'{name}_sum{_labels(pairs)} {_number(float(total))}')
+    lines.append(f'{name}_count{_labels(pairs)} {count}')
+    return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(list(zip(self.labels, label_values)))} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [cumulative bucket counts, count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, count, total) in sorted(self._values.items()):
+                lines.extend(_histogram_lines(self.name, list(zip(self.labels, label_values)), self.buckets, counts, count, total))
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint, method and status code.', ('method', 'endpoint', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent building the response.', ('method', 'endpoint'))
+REQUEST_QUERIES = Histogram('http_request_sql_statements', 'SQL statements run per request.', ('method', 'endpoint'), QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL statements per request.', ('method', 'endpoint'))
+QUERY_BUDGET_EXCEEDED = Counter('http_request_sql_budget_exceeded_total', 'Requests over METRICS_QUERY_BUDGET statements.', ('method', 'endpoint'))
+SMTP_LATENCY = Histogram('smtp_duration_seconds', 'SMTP connect and send times.', ('operation',))
+SMTP_EMAILS = Counter('smtp_emails_total', 'Outbox emails by delivery result.', ('result',))
+AUTOCOMPLETE_LATENCY = Histogram('autocomplete_lookup_duration_seconds', 'Prefix index lookups of /autocomplete.', (), MICROSECOND_BUCKETS)
+
+REGISTRY = [REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, QUERY_BUDGET_EXCEEDED, SMTP_LATENCY, SMTP_EMAILS,
+            AUTOCOMPLETE_LATENCY]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'metrics_start' not in g:
+        return
+    g.metrics_queries += 1
+    g.metrics_db_time += time.perf_counter() - conn.info.pop('metrics_query_start', time.perf_counter())
+    if g.metrics_statements is not None:
+        g.metrics_statements[statement] += 1
+
+
+def _endpoint():
+    # The route pattern keeps the label set small (/profile/<int:user_id>, not every id)
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.query_budget = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.query_budget = app.config.setdefault('METRICS_QUERY_BUDGET', int(os.getenv('METRICS_QUERY_BUDGET', 0)))
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['metrics'] = self
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_time = 0.0
+        g.metrics_statements = StatementCounter() if self.query_budget else None
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        method, endpoint = request.method, _endpoint()
+        REQUESTS.inc(method, endpoint, str(response.status_code))
+        REQUEST_LATENCY.observe(time.perf_counter() - g.metrics_start, method, endpoint)
+        REQUEST_QUERIES.observe(g.metrics_queries, method, endpoint)
+        REQUEST_DB_TIME.observe(g.metrics_db_time, method, endpoint)
+
+        if self.query_budget and g.metrics_queries > self.query_budget:
+            QUERY_BUDGET_EXCEEDED.inc(method, endpoint)
+            repeated = '; '.join(
+                f'{count}x {" ".join(statement.split())[:200]}'
+                for statement, count in g.metrics_statements.most_common(3)
+            )
+            current_app.logger.warning(
+                'Query budget exceeded: %s %s ran %d SQL statements (budget %d)',
+                method, request.path, g.metrics_queries, self.query_budget,
+                extra={'endpoint': endpoint, 'sql_statements': g.metrics_queries, 'most_repeated': repeated}
+            )
+        return response
+
+
+def _hashing_lines(hashing):
+    stats = hashing.metrics()
+    lines = ['# HELP bcrypt_duration_seconds Password hash and check times, including the pool queue wait.',
+             '# TYPE bcrypt_duration_seconds histogram']
+    for operation in ('hash', 'check'):
+        op = stats[operation]
+        lines.extend(_histogram_lines('bcrypt_duration_seconds', [('operation', operation)],
+                                      stats['latency_buckets'], op['buckets'], op['count'], op['sum']))
+    for name, kind, help in [
+        ('in_flight', 'gauge', 'Hashes running or waiting for a pool worker.'),
+        ('queue_depth', 'gauge', 'Hashes waiting for a pool worker.'),
+        ('pool_size', 'gauge', 'Hashing pool workers.'),
+        ('rejected', 'counter', 'Hashes refused with a 503 because the pool queue was full.'),
+    ]:
+        metric = f'bcrypt_{name}_total' if kind == 'counter' else f'bcrypt_{name}'
+        lines.extend([f'# HELP {metric} {help}', f'# TYPE {metric} {kind}', f'{metric} {stats[name]}'])
+    return lines
+
+
+def _autocomplete_lines(autocomplete):
+    sizes = autocomplete.metrics()
+    lines = []
+    for name, column, help in [
+        ('autocomplete_terms', 0, 'Terms in the prefix index.'),
+        ('autocomplete_memory_bytes', 1, 'Approximate memory held by the prefix index.'),
+    ]:
+        lines.extend([f'# HELP {name} {help}', f'# TYPE {name} gauge'])
+        lines.extend(f'{name}{_labels([("field", field)])} {size[column]}' for field, size in sorted(sizes.items()))
+    return lines
+
+
+def render_metrics():
+    """Every metric of this process in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    hashing = current_app.extensions.get('password_hasher')
+    if hashing is not None:
+        lines.extend(_hashing_lines(hashing))
+    autocomplete = current_app.extensions.get('autocomplete')
+    if autocomplete is not None:
+        lines.extend(_autocomplete_lines(autocomplete))
+    return '\n'.join(lines) + '\n'
@@ -1,8 +1,10 @@
-from flask_sqlalchemy import SQLAlchemy
+from api.db_routing import RoutingSQLAlchemy
 from sqlalchemy.dialects.postgresql import ENUM
 from enum import Enum
+from datetime import datetime
 
-db = SQLAlchemy()
+# Session that sends the reads of GET requests to the replica when there is one, see api/db_routing.py
+db = RoutingSQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -20,6 +22,10 @@ class User(db.Model):
     description = db.Column(db.String(250), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     average_score = db.Column(db.Float, nullable=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    score_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on every change visible in the profile or its reviews, used for the ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Relationships to Review model
     reviews_written = db.relationship('Review', foreign_keys='Review.reviewer_id', back_populates='reviewer', lazy='dynamic')
@@ -34,20 +40,35 @@ class User(db.Model):
     favorite_to = db.relationship('Favorite', foreign_keys='Favorite.favorite_to_id', back_populates='favorite_to')
 
     def calculate_average_score(self):
-        reviews = Review.query.filter_by(reviewee_id=self.id).all()
-        print(f"Calculando average_score para user_id {self.id}, reseñas: {len(reviews)}")
-        
-        if not reviews:
-            self.average_score = 3  # Media if 0 reviews
-            db.session.commit() 
-            return 3
-        
-        total_score = sum(review.score for review in reviews)
-        average = total_score / len(reviews)
-        self.average_score = average  
-        db.session.commit() 
-        print(f"Nuevo average_score para user_id {self.id}: {self.average_score}")
-        return average
+        # Derived from the running aggregates, no need to scan the reviews
+        if not self.review_count:
+            return 3  # Media if 0 reviews
+        return self.score_sum / self.review_count
+
+    @staticmethod
+    def apply_review_change(user_id, count_delta, score_delta):
+        """Update the review aggregates of a user with a single UPDATE.
+
+        Runs inside the caller's transaction, so the review change and the
+        aggregates are committed (or rolled back) together.
+        """
+        new_count = User.review_count + count_delta
+        new_sum = User.score_sum + score_delta
+        User.query.filter_by(id=user_id).update({
+            User.review_count: new_count,
+            User.score_sum: new_sum,
+            User.average_score: db.case(
+                (new_count > 0, db.cast(new_sum, db.Float) / new_count),
+                else_=3
+            ),
+            User.version: User.version + 1
+        }, synchronize_session=False)
+        refresh_best_sharer(user_id)
+
+    @staticmethod
+    def bump_version(*filters):
+        # Invalidates the ETags of the matching users, inside the caller's transaction
+        User.query.filter(*filters).update({User.version: User.version + 1}, synchronize_session=False)
 
     def __repr__(self):
         return f'<User {self.email}>'
@@ -93,6 +114,77 @@ class Match(db.Model):
     match_to = db.relationship('User', foreign_keys=[match_to_id], back_populates='match_to')
     match_status = db.Column(ENUM(*[status.value for status in MatchStatus], name='match_status_enum'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_matches_to_status', 'match_to_id', 'match_status'),
+        db.Index('ix_matches_from_status', 'match_from_id', 'match_status'),
+    )
+
+class Connection(db.Model):
+    # Both directions of every accepted match: the connections of a user are one range of the primary key
+    __tablename__ = 'connections'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    friend_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
+    @staticmethod
+    def sync_pair(user_id, other_id):
+        """Add or remove the two rows of a pair of users after one of their matches changed.
+
+        They are connected while any match between them is accepted. Runs inside the caller's
+        transaction, so the match and the connections are committed (or rolled back) together.
+        """
+        accepted = db.session.query(Match.query.filter(
+            ((Match.match_from_id == user_id) & (Match.match_to_id == other_id))
+            | ((Match.match_from_id == other_id) & (Match.match_to_id == user_id)),
+            Match.match_status == MatchStatus.ACCEPTED.value
+        ).exists()).scalar()
+        Connection.query.filter(
+            ((Connection.user_id == user_id) & (Connection.friend_id == other_id))
+            | ((Connection.user_id == other_id) & (Connection.friend_id == user_id))
+        ).delete(synchronize_session=False)
+        if accepted:
+            db.session.add_all([Connection(user_id=user_id, friend_id=other_id), Connection(user_id=other_id, friend_id=user_id)])
+
+def rebuild_connections(first_user_id, last_user_id):
+    # Rewrite the connections of a range of users from the accepted matches, the caller commits
+    Connection.query.filter(Connection.user_id.between(first_user_id, last_user_id)).delete(synchronize_session=False)
+    accepted = Match.match_status == MatchStatus.ACCEPTED.value
+    db.session.execute(
+        Connection.__table__.insert().from_select(
+            ['user_id', 'friend_id'],
+            db.union(
+                db.select(Match.match_from_id, Match.match_to_id).where(
+                    accepted, Match.match_from_id.between(first_user_id, last_user_id)
+                ),
+                db.select(Match.match_to_id, Match.match_from_id).where(
+                    accepted, Match.match_to_id.between(first_user_id, last_user_id)
+                )
+            )
+        )
+    )
+
+def rebuild_review_aggregates(user_ids):
+    # Recompute review_count, score_sum and average_score of some users from the reviews, the caller commits
+    aggregates = {
+        reviewee_id: (count, score_sum)
+        for reviewee_id, count, score_sum in db.session.query(
+            Review.reviewee_id,
+            db.func.count(Review.id),
+            db.func.coalesce(db.func.sum(Review.score), 0)
+        ).filter(Review.reviewee_id.in_(user_ids)).group_by(Review.reviewee_id)
+    }
+
+    mappings = []
+    for user_id in user_ids:
+        count, score_sum = aggregates.get(user_id, (0, 0))
+        mappings.append({
+            'id': user_id,
+            'review_count': count,
+            'score_sum': score_sum,
+            'average_score': score_sum / count if count else 3
+        })
+    db.session.bulk_update_mappings(User, mappings)
+
 class SkillNameEnum(Enum):
     COOKING = 'Cooking'
     SPORTS = 'Sports'
@@ -101,6 +193,15 @@ class SkillNameEnum(Enum):
     ART = 'Art'
     OTHERS = 'Others'
 
+    @classmethod
+    def match(cls, term):
+        # Resolve free text to enum members: prefix matches first, then substring matches
+        term = term.strip().lower()
+        if not term:
+            return []
+        members = [member for member in cls if member.value.lower().startswith(term)]
+        return members or [member for member in cls if term in member.value.lower()]
+
 class Categories(db.Model):
     __tablename__ = 'categories'
     
@@ -111,10 +212,17 @@ class Categories(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'skill_name', name='unique_user_skill'),
+        db.Index('ix_categories_skill_user', 'skill_name', 'user_id'),
     )
     
     user = db.relationship('User', backref=db.backref('categories', lazy=True))
 
+    def serialize(self):
+        return {
+            "skill_name": self.skill_name,
+            "description": self.description or ""
+        }
+
 class Review(db.Model):
     __tablename__ = 'reviews'
     
@@ -123,6 +231,11 @@ class Review(db.Model):
     reviewee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.String(250), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_reviews_reviewee_id', 'reviewee_id'),
+        db.Index('ix_reviews_reviewer_reviewee', 'reviewer_id', 'reviewee_id'),
+    )
     
     # Relationship to the User model
     reviewer = db.relationship('User', foreign_keys=[reviewer_id], back_populates='reviews_written')
@@ -140,16 +253,27 @@ class BestSharers(db.Model):
 
     user = db.relationship('User', backref=db.backref('best_sharers', uselist=False, lazy=True))
 
-def update_best_sharers():
-    BestSharers.query.delete()
+# Leaderboard index, matches the ORDER BY of /bestsharers
+db.Index('ix_best_sharers_rank', BestSharers.media_average.desc(), BestSharers.id)
 
-    users = User.query.all()
-    for user in users:
-        media_average = user.calculate_average_score()
-        if media_average is not None:
-            best_sharer = BestSharers(id=user.id, media_average=media_average)
-            db.session.add(best_sharer)
+def refresh_best_sharer(user_id):
+    # Keep the leaderboard row of one user in sync with its average_score
+    average = db.session.query(User.average_score).filter_by(id=user_id).scalar()
+    updated = BestSharers.query.filter_by(id=user_id).update(
+        {BestSharers.media_average: average}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(BestSharers(id=user_id, media_average=average))
 
+def update_best_sharers():
+    # Rebuild the whole leaderboard with one INSERT ... SELECT
+    BestSharers.query.delete()
+    db.session.execute(
+        BestSharers.__table__.insert().from_select(
+            ['id', 'media_average'],
+            db.select(User.id, db.func.coalesce(User.average_score, 3))
+        )
+    )
     db.session.commit()
 
 
@@ -161,4 +285,26 @@ class TokenRestorePassword(db.Model):
     user = db.relationship('User', backref=db.backref('tokens', lazy=True))
 
     def __repr__(self):
-        return f'<TokenRestorePassword {self.reset_token}>' 
\ No newline at end of file
+        return f'<TokenRestorePassword {self.reset_token}>' 
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    sender = db.Column(db.String(120), nullable=True)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
@@ -0,0 +1,120 @@
+"""
+Transactional email outbox.
+
+Request handlers only add an EmailOutbox row to the current transaction (queue_email), so the email
+is stored or rolled back together with the data it belongs to. A background sender drains the table
+in batches over a single SMTP connection, retrying failures with exponential backoff.
+
+Run it as its own process ($ flask send-outbox) or, on single process deployments, inside the web
+process with EMAIL_OUTBOX_THREAD=1.
+"""
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from api.models import db, EmailOutbox
+from api.metrics import SMTP_LATENCY, SMTP_EMAILS
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # seconds, doubled on every failed attempt
+POLL_INTERVAL = 5
+
+
+def queue_email(recipient, subject, html, sender=None):
+    email = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        html=html,
+        sender=sender or os.getenv("MAIL_USERNAME")
+    )
+    db.session.add(email)
+    return email
+
+
+def get_mail(app):
+    # Flask-Mail is only imported by the processes that send
+    if 'mail' not in app.extensions:
+        from flask_mail import Mail
+        Mail(app)
+    return app.extensions['mail']
+
+
+def _failed(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)[:255]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + timedelta(seconds=BACKOFF_BASE * 2 ** (email.attempts - 1))
+
+
+def send_pending(mail, batch_size=BATCH_SIZE):
+    """Send one batch of due emails, returns how many were sent."""
+    from flask_mail import Message
+    now = datetime.utcnow()
+    emails = EmailOutbox.query.filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    if not emails:
+        db.session.rollback()
+        return 0
+
+    sent = 0
+    handled = set()
+    try:
+        # One SMTP connection for the whole batch
+        start = time.perf_counter()
+        with mail.connect() as connection:
+            SMTP_LATENCY.observe(time.perf_counter() - start, 'connect')
+            for email in emails:
+                msg = Message(subject=email.subject, recipients=[email.recipient], sender=email.sender)
+                msg.html = email.html
+                start = time.perf_counter()
+                try:
+                    connection.send(msg)
+                except Exception as e:
+                    _failed(email, e, now)
+                    SMTP_EMAILS.inc('failed')
+                else:
+                    email.status = 'sent'
+                    email.sent_at = datetime.utcnow()
+                    # Only the rows still failing keep an error
+                    email.last_error = None
+                    sent += 1
+                    SMTP_EMAILS.inc('sent')
+                SMTP_LATENCY.observe(time.perf_counter() - start, 'send')
+                handled.add(email.id)
+    except Exception as e:
+        # Could not connect (or the connection dropped), retry what wasn't sent
+        for email in emails:
+            if email.id not in handled:
+                _failed(email, e, now)
+                SMTP_EMAILS.inc('failed')
+
+    db.session.commit()
+    return sent
+
+
+def run_sender(app, mail, interval=POLL_INTERVAL, batch_size=BATCH_SIZE, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                sent = send_pending(mail, batch_size)
+            except Exception:
+                db.session.rollback()
+                sent = 0
+            finally:
+                db.session.remove()
+        # Keep draining while full batches come back
+        if sent < batch_size:
+            stop_event.wait(interval)
+
+
+def start_sender_thread(app):
+    thread = threading.Thread(target=run_sender, args=(app, get_mail(app)), name='email-outbox', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,112 @@
+"""
+EXPLAIN checks for the queries on the hot paths of src/app.py.
+
+Every entry mirrors the filters an endpoint uses. check_query_plans() explains them against the
+current database and reports the ones that fall back to a sequential scan of one of our tables.
+check_profile_query_count() requests /profile/<id>/full for the users with the most and the fewest
+reviews and counts the statements each one runs, which must be the same and within the budget.
+"""
+import re
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from api.models import db, User, Review, Match, MatchStatus, Categories, BestSharers, TokenRestorePassword
+from api.matches import match_query
+from api.connections import connection_query, mutual_query, suggestion_query
+
+# Statements of GET /profile/<id>/full: user, categories, reviews with their reviewers, counts
+PROFILE_FULL_QUERY_BUDGET = 4
+
+TABLES = ['user', 'reviews', 'matches', 'connections', 'categories', 'favorite', 'best_sharers', 'token_restore_password']
+
+
+def hot_path_queries():
+    user_id = 1
+    return {
+        'login / signup (email)': User.query.filter_by(email='someone@test.com'),
+        'GET /users (keyset page)': User.query.filter(User.id > user_id).order_by(User.id).limit(100),
+        'GET /user/<id>/reviews': Review.query.filter_by(reviewee_id=user_id),
+        'POST /add/review (existing review)': Review.query.filter_by(reviewer_id=user_id, reviewee_id=2),
+        'GET /match?type=incoming': Match.query.filter_by(match_to_id=user_id, match_status=MatchStatus.PENDING.value),
+        'GET /match?type=outgoing': Match.query.filter_by(match_from_id=user_id, match_status=MatchStatus.PENDING.value),
+        'GET /match?type=accepted': db.session.query(*match_query(user_id, 'accepted', 0).subquery().c),
+        'GET /connections/<id>': connection_query(user_id, 0, 50),
+        'GET /connections/<id>/mutual/<id>': mutual_query(user_id, 2, 0, 50),
+        'GET /connections/suggestions': suggestion_query(user_id, 10),
+        'POST /match (existing match)': Match.query.filter_by(match_from_id=user_id, match_to_id=2),
+        'POST /add/skill (user skills)': Categories.query.filter_by(user_id=user_id),
+        'GET /search/usersbyskill': User.query.filter(
+            User.id.in_(db.session.query(Categories.user_id).filter(Categories.skill_name.in_(['Cooking', 'Music'])))
+        ).order_by(User.id).limit(50),
+        'GET /bestsharers': db.session.query(User, BestSharers.media_average).join(
+            BestSharers, BestSharers.id == User.id
+        ).order_by(BestSharers.media_average.desc(), BestSharers.id).limit(6),
+        'POST /reset-password (token)': TokenRestorePassword.query.filter(
+            TokenRestorePassword.reset_token == 'token', TokenRestorePassword.expires_at > datetime(2024, 1, 1)
+        ),
+    }
+
+
+def explain(query):
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'postgresql':
+        return [row[0] for row in db.session.execute(db.text('EXPLAIN ' + sql))]
+    # SQLite: (id, parent, notused, detail)
+    return [row[3] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+def sequential_scans(plan):
+    scans = []
+    for line in plan:
+        # PostgreSQL: 'Seq Scan on reviews', SQLite: 'SCAN reviews' (without USING INDEX)
+        found = re.search(r'Seq Scan on "?(\w+)"?', line) or re.match(r'SCAN (\w+)(?!.*USING)', line)
+        if found and found.group(1) in TABLES:
+            scans.append(found.group(1))
+    return scans
+
+
+def check_query_plans():
+    """Return {name: (plan, tables scanned sequentially)} for every hot path query."""
+    results = {}
+    if db.engine.dialect.name == 'postgresql':
+        # Small seeded tables are cheaper to scan, so make the planner use an index whenever one exists
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    for name, query in hot_path_queries().items():
+        plan = explain(query)
+        results[name] = (plan, sequential_scans(plan))
+    db.session.rollback()
+    return results
+
+
+def count_queries(path):
+    """Status code of a GET request to path and the SQL statements it ran, on any engine (replica included)."""
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        response = current_app.test_client().get(path)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    return response.status_code, statements
+
+
+def check_profile_query_count():
+    """Return {user_id: (review_count, statements)} of /profile/<id>/full for the most and least reviewed users."""
+    from app import PROFILE_REVIEWS_MAX
+    most = User.query.order_by(User.review_count.desc(), User.id).first()
+    fewest = User.query.order_by(User.review_count, User.id).first()
+    db.session.rollback()
+    if most is None or most.review_count == fewest.review_count:
+        return None
+
+    results = {}
+    for user in (most, fewest):
+        status, statements = count_queries(f'/profile/{user.id}/full?limit={PROFILE_REVIEWS_MAX}')
+        if status != 200:
+            raise RuntimeError(f'GET /profile/{user.id}/full returned {status}')
+        results[user.id] = (user.review_count, statements)
+    return results
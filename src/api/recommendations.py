@@ -0,0 +1,311 @@
+"""
+Skill exchange recommendations (GET /recommendations).
+
+Every user is one row of a few NumPy arrays kept in memory (a Snapshot): the offered
+skills (Categories) as a bitmask with one bit per SkillNameEnum member, the location as an integer
+code, the languages as a bitmask and the average_score. A request scores the whole candidate set in
+one batch of vector operations:
+
+    learn     skills the candidate offers that you don't have
+    teach     skills you offer that the candidate doesn't have
+    exchange  min(learn, teach), skills you can swap both ways
+    score     the weighted sum of exchange, learn, same location, a shared language and the rating
+
+Inactive users, yourself and everybody you already have a match with (any status, either
+direction) are left out, as are candidates with nothing to teach you.
+
+The ranking of every user is cached for RECOMMENDATIONS_CACHE_TTL seconds. Committed ORM changes
+to skills, profiles and matches mark the rows involved, which are reloaded with one query on the
+next request, and drop the cached rankings of the users involved. The snapshot is per process, so a
+new one is loaded every RECOMMENDATIONS_INDEX_TTL seconds to pick up the changes made by other
+workers and the bulk UPDATEs of the review aggregates. Only the first load blocks a request, the
+next ones run in a background thread while the old snapshot keeps serving.
+
+app.py imports this module on the first request that needs it, NumPy stays out of the startup.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from flask import current_app
+from sqlalchemy import event
+from api.models import db, User, Categories, Match, SkillNameEnum
+from api.session_hooks import on_commit, pending
+
+SKILLS = [skill.value for skill in SkillNameEnum]
+SKILL_BITS = {skill: 1 << position for position, skill in enumerate(SKILLS)}
+# Set bits of every uint8, the skills fit in one byte
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+WEIGHTS = {'exchange': 3.0, 'learn': 1.0, 'location': 2.0, 'language': 1.5, 'rating': 1.0}
+# Rankings are cached with this many entries, the endpoint returns a prefix
+MAX_RESULTS = 50
+
+PENDING_KEY = 'recommendations_pending'
+
+logger = logging.getLogger(__name__)
+
+
+def _location_key(location):
+    return (location or '').strip().lower()
+
+
+def _language_keys(language):
+    # "Spanish, English" / "Spanish/English"
+    return {part.strip().lower() for part in re.split(r'[,;/]', language or '') if part.strip()}
+
+
+class Snapshot:
+    """One row per user in every array, plus the vocabularies the locations and languages are coded with."""
+
+    def __init__(self):
+        self.locations, self.languages = {}, {}
+
+    @classmethod
+    def load(cls, connection):
+        """Every user and skill, two queries whatever the number of users."""
+        self = cls()
+        # Core rows, no ORM loading for a few hundred thousand tuples
+        users = connection.execute(
+            db.select(User.id, User.is_active, User.location, User.language, User.average_score).order_by(User.id)
+        ).all()
+        ids, active, locations, languages, ratings = zip(*users) if users else ((),) * 5
+        self.ids = np.array(ids, dtype=np.int64)
+        self.positions = dict(zip(ids, range(len(ids))))
+        self.active = np.array(active, dtype=bool)
+        self.location = self._encode(locations, self._location_code, np.int32)
+        self.language = self._encode(languages, self._language_mask, np.uint64)
+        self.rating = np.nan_to_num(np.array(ratings, dtype=np.float32), nan=3)
+
+        self.skills = np.zeros(len(ids), dtype=np.uint8)
+        skills = connection.execute(db.select(Categories.user_id, Categories.skill_name)).all()
+        if skills and len(ids):
+            user_ids, names = zip(*skills)
+            # ids is sorted, searchsorted finds the rows of every skill at once
+            user_ids = np.array(user_ids, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(self.ids, user_ids), len(ids) - 1)
+            found = self.ids[positions] == user_ids
+            bits = np.array([SKILL_BITS.get(name, 0) for name in names], dtype=np.uint8)
+            np.bitwise_or.at(self.skills, positions[found], bits[found])
+        return self
+
+    @staticmethod
+    def _encode(values, encoder, dtype):
+        # Few distinct locations and languages, each one is parsed once
+        codes = {}
+        return np.fromiter(
+            (codes[value] if value in codes else codes.setdefault(value, encoder(value)) for value in values),
+            dtype=dtype, count=len(values)
+        )
+
+    def _location_code(self, location):
+        key = _location_key(location)
+        if not key:
+            return -1
+        return self.locations.setdefault(key, len(self.locations))
+
+    def _language_mask(self, language):
+        mask = 0
+        for key in _language_keys(language):
+            # Past 64 languages the bits are shared, a collision only adds a little to the score
+            mask |= 1 << (self.languages.setdefault(key, len(self.languages)) % 64)
+        return mask
+
+    def refresh(self, user_ids):
+        """Reload the rows of some users (new ones are appended), two queries."""
+        users = db.session.query(User.id, User.is_active, User.location, User.language, User.average_score).filter(User.id.in_(user_ids)).all()
+        skills = {user_id: 0 for user_id in user_ids}
+        for user_id, skill_name in db.session.query(Categories.user_id, Categories.skill_name).filter(Categories.user_id.in_(user_ids)):
+            skills[user_id] |= SKILL_BITS.get(skill_name, 0)
+
+        new = [user for user in users if user.id not in self.positions]
+        if new:
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.array([user.id for user in new], dtype=np.int64)])
+            for name, dtype in (('active', bool), ('location', np.int32), ('language', np.uint64), ('rating', np.float32), ('skills', np.uint8)):
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(len(new), dtype=dtype)]))
+            for offset, user in enumerate(new):
+                self.positions[user.id] = start + offset
+
+        found = set()
+        for user in users:
+            position = self.positions[user.id]
+            found.add(user.id)
+            self.active[position] = bool(user.is_active)
+            self.location[position] = self._location_code(user.location)
+            self.language[position] = self._language_mask(user.language)
+            self.rating[position] = 3 if user.average_score is None else user.average_score
+            self.skills[position] = skills[user.id]
+        # Deleted users stay as inactive rows until the next load
+        for user_id in set(user_ids) - found:
+            if user_id in self.positions:
+                self.active[self.positions[user_id]] = False
+
+    def score(self, user_id, excluded_ids=()):
+        """Ranking of one user: [(candidate id, score, learn skills mask, teach skills mask)], best first."""
+        position = self.positions.get(user_id)
+        if position is None:
+            return []
+        mine = self.skills[position]
+        learn_mask = self.skills & ~mine
+        teach_mask = mine & ~self.skills
+        learn = POPCOUNT[learn_mask]
+        teach = POPCOUNT[teach_mask]
+
+        scores = (
+            WEIGHTS['exchange'] * np.minimum(learn, teach)
+            + WEIGHTS['learn'] * learn
+            + WEIGHTS['location'] * ((self.location == self.location[position]) & (self.location[position] >= 0))
+            + WEIGHTS['language'] * ((self.language & self.language[position]) != 0)
+            + WEIGHTS['rating'] * (self.rating - 1) / 4
+        )
+        candidates = self.active & (learn > 0)
+        candidates[position] = False
+        excluded = [self.positions[other] for other in excluded_ids if other in self.positions]
+        candidates[excluded] = False
+
+        indexes = np.flatnonzero(candidates)
+        if len(indexes) > MAX_RESULTS:
+            # Only the best need sorting, with every tie of the last one so the ids decide between them
+            cutoff = -np.partition(-scores[indexes], MAX_RESULTS - 1)[MAX_RESULTS - 1]
+            indexes = indexes[scores[indexes] >= cutoff]
+        indexes = indexes[np.lexsort((self.ids[indexes], -scores[indexes]))][:MAX_RESULTS]
+        return [
+            (int(self.ids[index]), float(scores[index]), int(learn_mask[index]), int(teach_mask[index]))
+            for index in indexes
+        ]
+
+
+class RecommendationIndex:
+    """The current Snapshot, the ids changed since it was loaded and the cached rankings."""
+
+    def __init__(self, cache_size=1024, cache_ttl=300, index_ttl=600):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.index_ttl = index_ttl
+        self.snapshot = None
+        self.built_at = None
+        self.stale = set()  # user ids whose rows must be reloaded
+        self.results = OrderedDict()  # user id -> (expires_at, ranking)
+        self._refreshed = None  # ids refreshed while a new snapshot loads, None when not loading
+        self._lock = threading.Lock()
+
+    def build(self):
+        snapshot = Snapshot.load(db.session.connection())
+        with self._lock:
+            self.snapshot = snapshot
+            self.built_at = time.monotonic()
+
+    def refresh_stale(self):
+        # Called with the lock held
+        if self.stale:
+            self.snapshot.refresh(sorted(self.stale))
+            if self._refreshed is not None:
+                self._refreshed |= self.stale
+            self.stale.clear()
+
+    def recommend(self, user_id):
+        with self._lock:
+            cached = self.results.get(user_id)
+            if cached is not None and cached[0] >= time.monotonic():
+                self.results.move_to_end(user_id)
+                return cached[1]
+
+        if self.snapshot is None:
+            self.build()
+        excluded_ids = matched_user_ids(user_id)
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self.built_at > self.index_ttl and self._refreshed is None:
+                # The old snapshot keeps serving while the new one loads
+                self._refreshed = set()
+                threading.Thread(target=self._rebuild, args=(current_app._get_current_object(),), daemon=True).start()
+            self.refresh_stale()
+            ranking = self.snapshot.score(user_id, excluded_ids)
+            if self.cache_size:
+                self.results[user_id] = (now + self.cache_ttl, ranking)
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+            return ranking
+
+    def _rebuild(self, app):
+        snapshot = None
+        with app.app_context():
+            try:
+                snapshot = Snapshot.load(db.session.connection())
+            except Exception:
+                logger.exception('recommendations index rebuild failed')
+            finally:
+                db.session.remove()
+        with self._lock:
+            if snapshot is not None:
+                # Rows refreshed during the load may be older in the new snapshot, reload them again
+                self.stale |= self._refreshed
+                self.snapshot = snapshot
+            # Also after a failure, the next try is one TTL later
+            self.built_at = time.monotonic()
+            self._refreshed = None
+
+    def changed(self, profile_ids, match_user_ids):
+        with self._lock:
+            if self.snapshot is not None:
+                self.stale.update(profile_ids)
+            for user_id in (*profile_ids, *match_user_ids):
+                self.results.pop(user_id, None)
+
+
+index = RecommendationIndex()
+
+
+def matched_user_ids(user_id):
+    # Everybody with a match from or to the user, each half on its own index
+    return {other for other, in db.session.query(Match.match_to_id).filter(Match.match_from_id == user_id).union(
+        db.session.query(Match.match_from_id).filter(Match.match_to_id == user_id)
+    )}
+
+
+def skill_names(mask):
+    return [skill for skill in SKILLS if mask & SKILL_BITS[skill]]
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    pending(target, PENDING_KEY)[0].add(target.id)
+
+
+@event.listens_for(Categories, 'after_insert')
+@event.listens_for(Categories, 'after_update')
+@event.listens_for(Categories, 'after_delete')
+def _skills_changed(mapper, connection, target):
+    pending(target, PENDING_KEY)[0].add(target.user_id)
+
+
+@event.listens_for(Match, 'after_insert')
+@event.listens_for(Match, 'after_update')
+@event.listens_for(Match, 'after_delete')
+def _match_changed(mapper, connection, target):
+    pending(target, PENDING_KEY)[1].update((target.match_from_id, target.match_to_id))
+
+
+def _apply_committed(changed):
+    # No queries after the commit, the rows are reloaded by the next request
+    index.changed(*changed)
+
+
+on_commit(PENDING_KEY, lambda: (set(), set()), _apply_committed)
+
+
+def recommend(user_id):
+    """Ranking of the user for GET /recommendations, built or refreshed as needed."""
+    if index.snapshot is None:
+        config = current_app.config
+        index.cache_size = config.get('RECOMMENDATIONS_CACHE_SIZE', int(os.getenv('RECOMMENDATIONS_CACHE_SIZE', 1024)))
+        index.cache_ttl = config.get('RECOMMENDATIONS_CACHE_TTL', int(os.getenv('RECOMMENDATIONS_CACHE_TTL', 300)))
+        index.index_ttl = config.get('RECOMMENDATIONS_INDEX_TTL', int(os.getenv('RECOMMENDATIONS_INDEX_TTL', 600)))
+    return index.recommend(user_id)
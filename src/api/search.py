@@ -0,0 +1,116 @@
+"""
+Full-text search over the user profiles (name, last_name, location, language and description).
+
+PostgreSQL uses a generated tsvector column with a GIN index, SQLite uses an FTS5 table kept
+in sync with triggers. Both structures are created by the migrations (or install_search_index()).
+"""
+import re
+from api.models import db, User
+from api.serializers import query_user_rows
+
+SEARCH_COLUMNS = ['name', 'last_name', 'location', 'language', 'description']
+
+POSTGRES_SEARCH_DDL = [
+    """
+    ALTER TABLE "user" ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(last_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(location, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(language, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS ix_user_search_vector ON "user" USING GIN (search_vector)',
+]
+
+SQLITE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+        name, last_name, location, language, description,
+        content='user', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_insert AFTER INSERT ON user BEGIN
+        INSERT INTO user_fts(rowid, name, last_name, location, language, description)
+        VALUES (new.id, new.name, new.last_name, new.location, new.language, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_delete AFTER DELETE ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, name, last_name, location, language, description)
+        VALUES ('delete', old.id, old.name, old.last_name, old.location, old.language, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_update AFTER UPDATE OF name, last_name, location, language, description ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, name, last_name, location, language, description)
+        VALUES ('delete', old.id, old.name, old.last_name, old.location, old.language, old.description);
+        INSERT INTO user_fts(rowid, name, last_name, location, language, description)
+        VALUES (new.id, new.name, new.last_name, new.location, new.language, new.description);
+    END
+    """,
+    "INSERT INTO user_fts(user_fts) VALUES ('rebuild')",
+]
+
+# bm25 weights, same order as SEARCH_COLUMNS (names rank higher than the description)
+SQLITE_BM25_WEIGHTS = '10.0, 10.0, 5.0, 5.0, 1.0'
+
+
+def install_search_index():
+    # Create the full-text structures on the current database, the migrations do the same
+    dialect = db.engine.dialect.name
+    statements = {'postgresql': POSTGRES_SEARCH_DDL, 'sqlite': SQLITE_SEARCH_DDL}.get(dialect, [])
+    for statement in statements:
+        db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+def search_terms(query):
+    # Only word characters reach the tsquery / MATCH expressions
+    return re.findall(r'\w+', query.lower())
+
+
+def search_users(query, limit, offset=0, fields=None):
+    """Return the user rows (see api/serializers.py) matching every word of the query as a prefix, best ranked first."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return _search_postgres(terms, limit, offset, fields)
+    if dialect == 'sqlite':
+        return _search_sqlite(terms, limit, offset, fields)
+    return _search_ilike(query, limit, offset, fields)
+
+
+def _search_postgres(terms, limit, offset, fields):
+    ts_query = db.func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+    vector = db.literal_column('"user".search_vector')
+    return query_user_rows(fields=fields).filter(
+        vector.op('@@')(ts_query)
+    ).order_by(
+        db.func.ts_rank(vector, ts_query).desc(), User.id
+    ).limit(limit).offset(offset).all()
+
+
+def _search_sqlite(terms, limit, offset, fields):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    user_ids = [row[0] for row in db.session.execute(db.text(
+        f'SELECT rowid FROM user_fts WHERE user_fts MATCH :match '
+        f'ORDER BY bm25(user_fts, {SQLITE_BM25_WEIGHTS}), rowid LIMIT :limit OFFSET :offset'
+    ), {'match': match, 'limit': limit, 'offset': offset})]
+    if not user_ids:
+        return []
+
+    users = {row.id: row for row in query_user_rows(fields=fields).filter(User.id.in_(user_ids))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def _search_ilike(query, limit, offset=0, fields=None):
+    # Databases without a full-text index keep the old substring search
+    pattern = f'%{query}%'
+    return query_user_rows(fields=fields).filter(
+        db.or_(*[getattr(User, column).ilike(pattern) for column in SEARCH_COLUMNS])
+    ).order_by(User.id).limit(limit).offset(offset).all()
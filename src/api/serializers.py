@@ -0,0 +1,89 @@
+"""
+Fast path for the endpoints that return lists of users.
+
+Instead of loading full User instances into the identity map, the queries select only the columns
+User.serialize() reads (USER_FIELDS, in that order) and get plain row tuples back, which are turned
+into the same dicts serialize() builds. The payload is then encoded with one preconfigured C
+encoder, producing the same bytes as jsonify() outside debug mode.
+benchmarks/serialization_benchmark.py checks both paths stay byte-identical.
+
+?fields=name,location (get_user_fields()) narrows both the SELECT and the output to those fields.
+"""
+import json
+from flask import current_app, jsonify, request
+from api.models import db, User
+from api.utils import APIException
+
+USER_FIELDS = ['id', 'email', 'name', 'last_name', 'location', 'gender', 'language',
+               'profile_pic', 'description', 'phone', 'is_active', 'average_score']
+USER_COLUMNS = [getattr(User, field) for field in USER_FIELDS]
+
+# serialize() turns missing text into "", these three are returned as they are
+NULLABLE_FIELDS = {'id', 'is_active', 'average_score'}
+
+# Same settings as jsonify: sorted keys, ASCII only, compact separators
+_encoder = json.JSONEncoder(ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+
+
+def get_user_fields():
+    """The fields asked for with ?fields=a,b in USER_FIELDS order, None for all of them."""
+    value = request.args.get('fields')
+    if not value:
+        return None
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(USER_FIELDS)
+    if unknown:
+        raise APIException(f'Unknown fields: {", ".join(sorted(unknown))}', status_code=400)
+    return [field for field in USER_FIELDS if field in requested]
+
+
+def query_user_rows(*extra_columns, fields=None):
+    # With fields the rows are (id, *fields, *extra), the id is always there for the cursors
+    if fields is None:
+        return db.session.query(*USER_COLUMNS, *extra_columns)
+    return db.session.query(User.id, *[getattr(User, field) for field in fields if field != 'id'], *extra_columns)
+
+
+def serialize_user_rows(rows, fields=None):
+    if fields is not None:
+        return _serialize_fields(rows, fields)
+    # Same dicts as User.serialize(), unpacking the tuples is much cheaper than row attribute access
+    return [
+        {
+            "id": id,
+            "email": email,
+            "name": name or "",
+            "last_name": last_name or "",
+            "location": location or "",
+            "gender": gender or "",
+            "language": language or "",
+            "profile_pic": profile_pic or "",
+            "description": description or "",
+            "phone": phone or "",
+            "is_active": is_active,
+            "average_score": average_score
+        }
+        for id, email, name, last_name, location, gender, language,
+            profile_pic, description, phone, is_active, average_score, *_ in rows
+    ]
+
+
+def _serialize_fields(rows, fields):
+    # Rows of query_user_rows(fields=fields): the id first, then the other fields in order
+    columns = [field for field in fields if field != 'id']
+    positions = [(field, index, field in NULLABLE_FIELDS) for index, field in enumerate(columns, start=1)]
+    if 'id' in fields:
+        positions.insert(0, ('id', 0, True))
+    return [
+        {field: row[index] if keep_null else row[index] or "" for field, index, keep_null in positions}
+        for row in rows
+    ]
+
+
+def json_response(payload, status=200):
+    # Debug mode pretty prints, keep jsonify there so both paths always match
+    if current_app.debug:
+        response = jsonify(payload)
+        response.status_code = status
+        return response
+    return current_app.response_class(_encoder.encode(payload) + '\n', status=status, mimetype='application/json')
@@ -0,0 +1,45 @@
+"""
+Work that must run only once a transaction is committed, like dropping an in-process cache entry.
+
+ORM listeners (after_insert / after_update / after_delete, inside the flush) collect what changed with
+pending(target, key), stored in the session. After the commit the callback registered for the key
+with on_commit() gets it, and a rollback drops it, so the caches never see changes that didn't make
+it to the database. The callbacks run after the commit, they can't query through the session.
+"""
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+PENDING_KEY = 'on_commit_pending'
+
+logger = logging.getLogger(__name__)
+
+_callbacks = {}  # key -> (factory of the pending value, callback)
+
+
+def on_commit(key, factory, callback):
+    """Call callback(value) after every commit of a session that collected a value for key."""
+    _callbacks[key] = (factory, callback)
+
+
+def pending(target, key):
+    """The value collected for key in the session of an ORM instance, created by the factory on first use."""
+    collected = object_session(target).info.setdefault(PENDING_KEY, {})
+    if key not in collected:
+        collected[key] = _callbacks[key][0]()
+    return collected[key]
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_callbacks(session):
+    for key, value in session.info.pop(PENDING_KEY, {}).items():
+        try:
+            _callbacks[key][1](value)
+        except Exception:
+            # Already committed, the caller must not see it as a failed commit
+            logger.exception('on_commit callback %s failed', key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
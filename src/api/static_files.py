@@ -0,0 +1,139 @@
+"""
+Serves the built front end (public/) from an in-memory manifest.
+
+The directory is scanned once at startup: requests never touch the filesystem to decide what to
+send. Fingerprinted files (a content hash in the name, like main.3f9a1c0e2b.js) never change and are
+cached for a year as immutable; everything else revalidates with its ETag. Precompressed .br / .gz
+variants next to a file ($ flask compress-static) are sent to the clients that accept them.
+index.html, the fallback of every front end route, is kept in memory with its compressed versions.
+"""
+import os
+import re
+import gzip
+import mimetypes
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always there
+    brotli = None
+
+FINGERPRINT = re.compile(r'\.[0-9a-f]{8,}\.')
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.map', '.ico', '.xml')
+MIN_COMPRESS_SIZE = 1024
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+    def __init__(self, path, stat):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+        self.fingerprinted = bool(FINGERPRINT.search(os.path.basename(path)))
+        self.variants = {}  # encoding -> path of the precompressed file
+
+
+class StaticAssets:
+    def __init__(self, app=None, directory=None):
+        self.directory = None
+        self.assets = {}
+        self.index = None
+        self.index_variants = {}
+        self.reload_on_request = False
+        if app is not None:
+            self.init_app(app, directory)
+
+    def init_app(self, app, directory):
+        self.directory = os.path.realpath(directory)
+        # In debug mode the front end is rebuilt while the server runs
+        self.reload_on_request = app.debug
+        self.scan()
+        app.extensions['static_assets'] = self
+
+    def scan(self):
+        assets = {}
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                    assets[relative] = Asset(path, os.stat(path))
+
+        for relative in list(assets):
+            for encoding, suffix in ENCODINGS:
+                if relative.endswith(suffix) and relative[:-len(suffix)] in assets:
+                    assets[relative[:-len(suffix)]].variants[encoding] = assets.pop(relative).path
+                    break
+
+        index = assets.get('index.html')
+        self.index = None
+        self.index_variants = {}
+        if index is not None:
+            with open(index.path, 'rb') as f:
+                self.index = f.read()
+            self.index_variants['gzip'] = gzip.compress(self.index, 9, mtime=0)
+            if brotli is not None:
+                self.index_variants['br'] = brotli.compress(self.index)
+        self.assets = assets
+
+    def serve(self, path):
+        """Response for /<path>: the asset, or index.html for the front end routes."""
+        if self.reload_on_request:
+            self.scan()
+        asset = self.assets.get(path)
+        if asset is None or path == 'index.html':
+            return self.serve_index()
+
+        encoding = self._encoding(asset.variants)
+        file_path = asset.variants[encoding] if encoding else asset.path
+        response = send_file(file_path, mimetype=asset.mimetype, etag=f'{asset.etag}-{encoding}' if encoding else asset.etag,
+                             conditional=True, max_age=None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE if asset.fingerprinted else REVALIDATE
+        return response
+
+    def serve_index(self):
+        if self.reload_on_request:
+            self.scan()
+        if self.index is None:
+            return Response('Front end not built, run $ npm run build', status=404, mimetype='text/plain')
+
+        encoding = self._encoding(self.index_variants)
+        response = Response(self.index_variants[encoding] if encoding else self.index, mimetype='text/html')
+        response.set_etag(self.assets['index.html'].etag + (f'-{encoding}' if encoding else ''))
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = REVALIDATE
+        return response.make_conditional(request)
+
+    @staticmethod
+    def _encoding(variants):
+        for encoding, _ in ENCODINGS:
+            if encoding in variants and request.accept_encodings[encoding]:
+                return encoding
+        return None
+
+
+def compress_directory(directory):
+    """Write .gz (and .br with the brotli package) next to every compressible file, yields their names."""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+            yield os.path.relpath(path, directory)
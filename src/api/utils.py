@@ -1,4 +1,6 @@
-from flask import jsonify, url_for
+import base64
+import binascii
+from flask import jsonify, url_for, request
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +17,23 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(last_id):
+    # Opaque keyset cursor, the client just sends it back in ?after=
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise APIException('Invalid cursor', status_code=400)
+
+def get_page_args(default_limit, max_limit):
+    limit = request.args.get('limit', default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    after = request.args.get('after')
+    return limit, decode_cursor(after) if after else 0
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
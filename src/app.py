@@ -1,94 +1,162 @@
 import os
 import re
+import json
 import uuid
+import logging
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, send_from_directory
-from flask_mail import Mail, Message
-from flask_migrate import Migrate
+import click
+from flask import Flask, Blueprint, current_app, request, jsonify, render_template, Response, stream_with_context
 from flask_jwt_extended import (
     create_access_token,
     get_jwt_identity,
+    current_user,
     decode_token,
     JWTManager,
     jwt_required
 )
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
-from datetime import timedelta
-from api.utils import APIException, generate_sitemap
-from api.models import db, User, TokenRestorePassword, Categories, Match, Review ,SkillNameEnum ,MatchStatus
+from sqlalchemy.orm import joinedload, selectinload, load_only
+from api.utils import APIException, generate_sitemap, encode_cursor, get_page_args
+from api.models import db, User, TokenRestorePassword, Categories, Match, Review, BestSharers, Favorite, SkillNameEnum, MatchStatus, Connection
 from api.routes import api
-from api.admin import setup_admin
-from api.commands import setup_commands
-from flask_cors import CORS
-
-app = Flask(__name__)
+from api.search import search_users as full_text_search
+from api.matches import MATCH_TYPES, match_rows, serialize_match_rows
+from api.connections import connection_rows, connection_count, mutual_rows, mutual_count, suggestion_rows
+from api.hashing import PasswordHasher
+from api.logs import setup_logging
+from api.auth import setup_current_user, current_user_row
+from api.db_routing import setup_read_replica, read_primary, engine_options
+from api.metrics import Metrics, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from api.outbox import queue_email, start_sender_thread
+from api.serializers import query_user_rows, serialize_user_rows, get_user_fields, json_response
+from api.static_files import StaticAssets
+from api.compression import setup_compression
+from api.autocomplete import Autocomplete, FIELDS as AUTOCOMPLETE_FIELDS
 
 ENV = "development" if os.getenv("FLASK_DEBUG") == "1" else "production"
 static_file_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../public/')
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-# Setup JWT 
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT-KEY")
-jwt = JWTManager(app)
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=2)
-
-# Setup CORS
-CORS(app) 
-
-bcrypt = Bcrypt(app)
-
-# Setup Flask-mail
-app.config.update(dict(
-    DEBUG = False,
-    MAIL_SERVER = 'smtp.gmail.com',
-    MAIL_PORT = 587,
-    MAIL_USE_TLS = True,
-    MAIL_USE_SSL = False,
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-))
-mail = Mail(app)
-
-# Database configuration
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-MIGRATE = Migrate(app, db, compare_type=True)
-db.init_app(app)
-
-# add the admin
-setup_admin(app)
-setup_commands(app)
-
-# Add all endpoints from the API with a "api" prefix
-app.register_blueprint(api, url_prefix='/api')
-
-@app.errorhandler(APIException)
+
+logger = logging.getLogger(__name__)
+
+# Extensions live here and are bound to the app in create_app()
+jwt = JWTManager()
+# Password hashing runs on a bounded process pool, see api/hashing.py
+bcrypt = PasswordHasher()
+# Per request latency, status codes and SQL statements, served at /metrics (api/metrics.py)
+metrics = Metrics()
+# public/ served from an in-memory manifest with long caching for fingerprinted files (api/static_files.py)
+static_assets = StaticAssets()
+# Prefix index of names, last names, locations and languages for /autocomplete (api/autocomplete.py)
+autocomplete = Autocomplete()
+
+# Every endpoint of this file
+main = Blueprint('main', __name__)
+
+
+def create_app(config=None):
+    """
+    Build the application. `config` overrides the settings read from the environment.
+
+    Flask-Admin is only loaded with ENABLE_ADMIN=1 (the default with FLASK_DEBUG=1), Flask-Migrate and
+    the commands only under the flask CLI, and Flask-Mail only by the processes that send the outbox.
+    Nothing here opens a database connection, so the app can be preloaded and forked by gunicorn
+    (see gunicorn.conf.py).
+    """
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.config['DEBUG'] = False
+    if config:
+        app.config.update(config)
+
+    # JSON logs through a background queue, with request ids (api/logs.py)
+    setup_logging(app)
+
+    # Also the JWT key when JWT-KEY is not set
+    app.secret_key = app.secret_key or os.environ.get('FLASK_APP_KEY', 'sample key')
+
+    # Setup JWT
+    app.config.setdefault("JWT_SECRET_KEY", os.getenv("JWT-KEY"))
+    app.config.setdefault('JWT_ACCESS_TOKEN_EXPIRES', timedelta(hours=2))
+    jwt.init_app(app)
+    # current_user for the @jwt_required endpoints, cached per process (api/auth.py)
+    setup_current_user(app, jwt)
+
+    # Setup CORS
+    CORS(app)
+
+    bcrypt.init_app(app)
+    metrics.init_app(app)
+    static_assets.init_app(app, static_file_dir)
+    autocomplete.init_app(app)
+    # gzip / brotli for large responses, registered after the metrics so they include it
+    setup_compression(app)
+
+    # Flask-mail settings, the extension itself is created by the outbox sender
+    for key, value in dict(
+        MAIL_SERVER = os.getenv("MAIL_SERVER", 'smtp.gmail.com'),
+        MAIL_PORT = int(os.getenv("MAIL_PORT", 587)),
+        MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "1") == "1",
+        MAIL_USE_SSL = False,
+        MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
+        MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+    ).items():
+        app.config.setdefault(key, value)
+
+    # Database configuration
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config.setdefault('SQLALCHEMY_DATABASE_URI', db_url.replace("postgres://", "postgresql://"))
+    else:
+        app.config.setdefault('SQLALCHEMY_DATABASE_URI', "sqlite:////tmp/test.db")
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    # Optional read replica for GET requests (DATABASE_REPLICA_URL)
+    setup_read_replica(app)
+    db.init_app(app)
+
+    # Migrations and commands are only needed by the flask CLI (alembic is slow to import)
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        from api.commands import setup_commands
+        Migrate(app, db, compare_type=True)
+        setup_commands(app)
+
+    # Emails are queued in the outbox and sent in the background, see api/outbox.py
+    if os.getenv("EMAIL_OUTBOX_THREAD") == "1":
+        start_sender_thread(app)
+
+    # add the admin
+    if app.config.setdefault('ENABLE_ADMIN', os.getenv("ENABLE_ADMIN", "1" if ENV == "development" else "0") == "1"):
+        from api.admin import setup_admin
+        setup_admin(app)
+
+    app.register_blueprint(main)
+    # Add all endpoints from the API with a "api" prefix
+    app.register_blueprint(api, url_prefix='/api')
+    return app
+
+
+@main.app_errorhandler(APIException)
 def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
-@app.route('/')
+    response = jsonify(error.to_dict())
+    if getattr(error, 'retry_after', None):
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status_code
+@main.route('/')
 def sitemap():
     if ENV == "development":
-        return generate_sitemap(app)
-    return send_from_directory(static_file_dir, 'index.html')
-@app.route('/<path:path>', methods=['GET'])
+        return generate_sitemap(current_app)
+    return static_assets.serve_index()
+@main.route('/<path:path>', methods=['GET'])
 def serve_any_other_file(path):
-    if not os.path.isfile(os.path.join(static_file_dir, path)):
-        path = 'index.html'
-    response = send_from_directory(static_file_dir, path)
-    response.cache_control.max_age = 0  # avoid cache memory
-    return response
+    # Served from the manifest built at startup, unknown paths get index.html
+    return static_assets.serve(path)
 
 #Our Endpoints
 #SINGUP LOGIN , PRIVATE PROFILE AND PUBLIC PROFILES:
 
-@app.route("/signup", methods=["POST"])
+@main.route("/signup", methods=["POST"])
 def create_user():
     body = request.get_json(silent=True)
 
@@ -111,17 +179,20 @@ def create_user():
         return jsonify({'msg': 'Password must be at least 8 characters long'}), 400
 
     try:
-        pw_hash = bcrypt.generate_password_hash(body['password']).decode('utf-8')
+        pw_hash = bcrypt.generate_password_hash(body['password'])
         new_user = User(email=body['email'], password=pw_hash, is_active=is_active, average_score=3)  
+        new_user.best_sharers = BestSharers(media_average=3)
         db.session.add(new_user)
         db.session.commit()
         return jsonify({'msg': 'New User Created', 'user_id': new_user.id}), 201
+    except APIException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'msg': str(e)}), 500
 
 
-@app.route("/login", methods=["POST"])
+@main.route("/login", methods=["POST"])
 def login():
     try:
         body = request.get_json(silent=True)
@@ -145,12 +216,25 @@ def login():
         access_token = create_access_token(identity=user.id)
         return jsonify(access_token=access_token), 200
     
+    except APIException:
+        raise
     except Exception as e:
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
+@main.route('/metrics/hashing', methods=['GET'])
+def hashing_metrics():
+    # Hash latency histogram and pool queue depth
+    return jsonify(bcrypt.metrics()), 200
+
+
+@main.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 
-@app.route('/update_user', methods=['PUT'])
+
+@main.route('/update_user', methods=['PUT'])
 @jwt_required()
 def update_user():
     body = request.get_json(silent=True)
@@ -158,8 +242,9 @@ def update_user():
     if body is None:
         return jsonify({'msg': 'Body is required'}), 400
 
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # Already loaded by the JWT user loader on a cache miss, one lookup otherwise
+    current_user_id = current_user.id
+    user = current_user_row()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -231,6 +316,12 @@ def update_user():
         return jsonify({"message": "No fields were updated"}), 400
 
     try:
+        user.version = User.version + 1
+        if name or last_name or profile_pic:
+            # Their reviews list shows this user's name and picture
+            User.bump_version(User.id.in_(
+                db.session.query(Review.reviewee_id).filter(Review.reviewer_id == current_user_id)
+            ))
         db.session.commit()
         return jsonify({"message": "User updated successfully", "user": user.serialize()}), 200
     except Exception as e:
@@ -239,30 +330,105 @@ def update_user():
 
     
 
-@app.route("/profile", methods=["GET"])
+def user_etag(kind, user_id):
+    # Only reads the version column, None if the user doesn't exist
+    version = db.session.query(User.version).filter_by(id=user_id).scalar()
+    return None if version is None else f'{kind}-{user_id}-{version}'
+
+def not_modified(etag, private=False):
+    response = Response(status=304)
+    return with_etag(response, etag, private)
+
+def with_etag(response, etag, private=False):
+    # Weak: the same version is valid for the compressed and the plain body
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    return response
+
+
+@main.route("/profile", methods=["GET"])
 @jwt_required()
+@read_primary
 def get_private_info():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # 304 after the version lookup, the row is only loaded for the body
+    etag = user_etag('private', current_user.id)
 
-    if not user:
+    if etag is None:
         return jsonify({'msg': 'User not found'}), 404
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag, private=True)
 
-    return jsonify({
+    user = current_user_row()
+    return with_etag(jsonify({
         'msg': 'Info correct, you logged in!',
         'user_data': user.serialize()  
-    })
+    }), etag, private=True)
 
-@app.route('/profile/<int:user_id>', methods=['GET'])
+@main.route('/profile/<int:user_id>', methods=['GET'])
 def view_user_profile(user_id):
-    user = User.query.get(user_id)
+    etag = user_etag('profile', user_id)
     
+    if etag is None:
+        return jsonify({'msg': 'User not found'}), 404
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    user = User.query.get(user_id)
+    return with_etag(jsonify({'user_data': user.serialize()}), etag), 200
+
+PROFILE_REVIEWS_DEFAULT = 20
+PROFILE_REVIEWS_MAX = 100
+
+@main.route('/profile/<int:user_id>/full', methods=['GET'])
+def view_full_profile(user_id):
+    # Everything the profile page needs in 4 queries, whatever the number of reviews (flask check-query-counts)
+    limit, after_id = get_page_args(PROFILE_REVIEWS_DEFAULT, PROFILE_REVIEWS_MAX)
+
+    user = User.query.options(selectinload(User.categories)).filter_by(id=user_id).first()
     if not user:
         return jsonify({'msg': 'User not found'}), 404
-    
-    return jsonify({'user_data': user.serialize()}), 200
 
-@app.route('/our/profiles', methods=['GET'])
+    reviews = Review.query.options(
+        joinedload(Review.reviewer).load_only(User.id, User.name, User.last_name, User.profile_pic)
+    ).filter(
+        Review.reviewee_id == user_id, Review.id > after_id
+    ).order_by(Review.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(reviews[limit - 1].id) if len(reviews) > limit else None
+
+    matches, favorites = db.session.query(
+        db.session.query(db.func.count()).filter(Connection.user_id == user_id).scalar_subquery(),
+        db.session.query(db.func.count(Favorite.favorite_id)).filter(
+            Favorite.favorite_to_id == user_id
+        ).scalar_subquery()
+    ).one()
+
+    return jsonify({
+        'user_data': user.serialize(),
+        'categories': [category.serialize() for category in user.categories],
+        'reviews': [
+            {
+                'id': review.id,
+                'reviewer_id': review.reviewer_id,
+                'score': review.score,
+                'comment': review.comment,
+                'reviewer_info': {
+                    'name': review.reviewer.name,
+                    'last_name': review.reviewer.last_name,
+                    'profile_pic': review.reviewer.profile_pic
+                }
+            } for review in reviews[:limit]
+        ],
+        'next_cursor': next_cursor,
+        'counts': {
+            'reviews': user.review_count,
+            'matches': matches,
+            'favorites': favorites
+        }
+    }), 200
+
+@main.route('/our/profiles', methods=['GET'])
 def our_profiles():
     profiles = [
         {
@@ -293,58 +459,133 @@ def our_profiles():
 
 #SEARCH & SKILLS:
 
-@app.route('/users', methods=['GET'])
+USERS_PAGE_DEFAULT = 100
+USERS_PAGE_MAX = 500
+USERS_STREAM_BATCH = 1000
+
+@main.route('/users', methods=['GET'])
 def list_users():
+    # Keyset pagination on User.id: ?limit=&after=<next_cursor>
+    # ?fields=name,location only selects and returns those columns
+    limit, after_id = get_page_args(USERS_PAGE_DEFAULT, USERS_PAGE_MAX)
+    fields = get_user_fields()
+
+    if request.args.get('format') == 'ndjson':
+        return stream_users(after_id, fields)
+
     try:
-        users = User.query.all()
-        return jsonify({'users': [user.serialize() for user in users]}), 200
+        users = query_user_rows(fields=fields).filter(User.id > after_id).order_by(User.id).limit(limit + 1).all()
+        next_cursor = encode_cursor(users[limit - 1].id) if len(users) > limit else None
+        return json_response({
+            'users': serialize_user_rows(users[:limit], fields),
+            'next_cursor': next_cursor
+        })
     except Exception as e:
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
-@app.route('/search/users', methods=['GET'])
+def stream_users(after_id, fields=None):
+    # One JSON object per line, read through a server-side cursor so memory stays flat
+    query = query_user_rows(fields=fields).filter(User.id > after_id).order_by(User.id).execution_options(
+        stream_results=True
+    ).yield_per(USERS_STREAM_BATCH)
+
+    def generate():
+        for user in query:
+            yield json.dumps(serialize_user_rows([user], fields)[0] if fields else User.serialize(user)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+SEARCH_PAGE_DEFAULT = 50
+SEARCH_PAGE_MAX = 200
+
+@main.route('/search/users', methods=['GET'])
 def search_users():
     query = request.args.get('query', '')
     
     if not query:
         return jsonify({'msg': 'Query parameter is required'}), 400
-    
-    users = User.query.filter(
-        (User.name.ilike(f'%{query}%')) |
-        (User.last_name.ilike(f'%{query}%')) |
-        (User.location.ilike(f'%{query}%')) |
-        (User.language.ilike(f'%{query}%')) |
-        (User.description.ilike(f'%{query}%')) 
-    ).all()
+
+    limit = request.args.get('limit', SEARCH_PAGE_DEFAULT, type=int)
+    limit = max(1, min(limit, SEARCH_PAGE_MAX))
+    page = max(1, request.args.get('page', 1, type=int))
+    fields = get_user_fields()
+
+    # Ranked full-text search, see api/search.py
+    users = full_text_search(query, limit, offset=(page - 1) * limit, fields=fields)
     
     if not users:
         return jsonify({'msg': 'No users found'}), 404
     
-    return jsonify({'users': [user.serialize() for user in users]}), 200
+    return json_response({'users': serialize_user_rows(users, fields), 'page': page})
+
+AUTOCOMPLETE_DEFAULT = 5
+AUTOCOMPLETE_MAX = 20
+
+@main.route('/autocomplete', methods=['GET'])
+def autocomplete_terms():
+    # ?prefix=mad&field=location&limit=5, from memory without touching the database
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix:
+        return jsonify({'msg': 'Prefix is required'}), 400
+    field = request.args.get('field')
+    if field is not None and field not in AUTOCOMPLETE_FIELDS:
+        return jsonify({'msg': f'Field must be one of: {", ".join(AUTOCOMPLETE_FIELDS)}'}), 400
+    limit = request.args.get('limit', AUTOCOMPLETE_DEFAULT, type=int)
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX))
+
+    results = autocomplete.lookup(prefix, limit, [field] if field else AUTOCOMPLETE_FIELDS)
+    response = json_response({
+        'suggestions': {
+            name: [{'text': text, 'users': users} for text, users in terms] for name, terms in results.items()
+        }
+    })
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
 
-@app.route('/search/usersbyskill', methods=['GET'])
+@main.route('/search/usersbyskill', methods=['GET'])
 def search_users_by_skill():
-    skill = request.args.get('skill', '').lower()
+    # ?skill=cook,music&match=any|all
+    terms = [term for term in request.args.get('skill', '').split(',') if term.strip()]
+    match_mode = request.args.get('match', 'any')
 
-    if not skill:
+    if not terms:
         return jsonify({'msg': 'Skill parameter is required'}), 400
+    if match_mode not in ('any', 'all'):
+        return jsonify({'msg': 'Match must be "any" or "all"'}), 400
+
+    limit, after_id = get_page_args(SEARCH_PAGE_DEFAULT, SEARCH_PAGE_MAX)
+    fields = get_user_fields()
+
+    # Resolve the text to enum values in Python, the database only sees equality/IN lookups
+    skill_groups = [[member.value for member in SkillNameEnum.match(term)] for term in terms]
 
     try:
-        users = db.session.query(User).join(Categories).filter(
-            Categories.skill_name.cast(db.String).ilike(f'%{skill}%')
-        ).all()
+        if match_mode == 'all':
+            if not all(skill_groups):
+                return jsonify({'msg': 'No users found with the specified skill'}), 404
+            filters = [
+                User.id.in_(db.session.query(Categories.user_id).filter(Categories.skill_name.in_(skills)))
+                for skills in skill_groups
+            ]
+        else:
+            skills = sorted({skill for skills in skill_groups for skill in skills})
+            if not skills:
+                return jsonify({'msg': 'No users found with the specified skill'}), 404
+            filters = [User.id.in_(db.session.query(Categories.user_id).filter(Categories.skill_name.in_(skills)))]
+
+        users = query_user_rows(fields=fields).filter(*filters, User.id > after_id).order_by(User.id).limit(limit + 1).all()
 
         if not users:
             return jsonify({'msg': 'No users found with the specified skill'}), 404
 
-        return jsonify({'users': [user.serialize() for user in users]}), 200
+        next_cursor = encode_cursor(users[limit - 1].id) if len(users) > limit else None
+        return json_response({'users': serialize_user_rows(users[:limit], fields), 'next_cursor': next_cursor})
 
     except Exception as e:
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-
-
-@app.route('/add/skill', methods=['POST'])
+@main.route('/add/skill', methods=['POST'])
 @jwt_required()
 def add_skill():
     try:
@@ -372,6 +613,7 @@ def add_skill():
         
         new_skill = Categories(user_id=user_id, skill_name=skill, description=description)
         db.session.add(new_skill)
+        User.bump_version(User.id == user_id)
         db.session.commit()
 
         return jsonify({
@@ -385,7 +627,7 @@ def add_skill():
         db.session.rollback()
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
     
-@app.route('/update/skill/<string:skill_name>', methods=['PUT'])
+@main.route('/update/skill/<string:skill_name>', methods=['PUT'])
 @jwt_required()
 def update_skill(skill_name):
     try:
@@ -406,6 +648,7 @@ def update_skill(skill_name):
             return jsonify({'msg': 'Skill not found'}), 404
         
         skill.description = new_description
+        User.bump_version(User.id == user_id)
         db.session.commit()
 
         return jsonify({
@@ -419,7 +662,7 @@ def update_skill(skill_name):
         db.session.rollback()
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
-@app.route('/delete/skill/<string:skill_name>', methods=['DELETE'])
+@main.route('/delete/skill/<string:skill_name>', methods=['DELETE'])
 @jwt_required()
 def delete_skill(skill_name):
     try:
@@ -436,6 +679,7 @@ def delete_skill(skill_name):
             return jsonify({'msg': 'Skill not found'}), 404
 
         db.session.delete(skill)
+        User.bump_version(User.id == user_id)
         db.session.commit()
 
         return jsonify({
@@ -451,7 +695,10 @@ def delete_skill(skill_name):
 
 #REVIEWS AND BESTSHARERS:
 
-@app.route('/add/review', methods=['POST'])
+BEST_SHARERS_DEFAULT = 6
+BEST_SHARERS_MAX = 50
+
+@main.route('/add/review', methods=['POST'])
 @jwt_required()
 def add_review():
     try:
@@ -465,10 +712,10 @@ def add_review():
         if reviewer_id == reviewee_id:
             return jsonify({'msg': 'You cannot review yourself!'}), 400
 
-        reviewer = User.query.get(reviewer_id)
+        # The reviewer is the current user, already loaded by @jwt_required
         reviewee = User.query.get(reviewee_id)
 
-        if not reviewer or not reviewee:
+        if not reviewee:
             return jsonify({'msg': 'Reviewer or reviewee does not exist'}), 404
 
         existing_review = Review.query.filter_by(reviewer_id=reviewer_id, reviewee_id=reviewee_id).first()
@@ -477,9 +724,7 @@ def add_review():
 
         new_review = Review(reviewer_id=reviewer_id, reviewee_id=reviewee_id, score=score, comment=comment)
         db.session.add(new_review)
-        db.session.commit()
-
-        reviewee.calculate_average_score()
+        User.apply_review_change(reviewee_id, 1, int(score))
         db.session.commit()
 
         return jsonify({'review_id': new_review.id, 'msg': 'Review added successfully'}), 201
@@ -489,7 +734,7 @@ def add_review():
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-@app.route('/update/review/<int:review_id>', methods=['PUT'])
+@main.route('/update/review/<int:review_id>', methods=['PUT'])
 @jwt_required()
 def update_review(review_id):
     try:
@@ -505,18 +750,16 @@ def update_review(review_id):
         score = request.json.get('score', '')
         comment = request.json.get('comment', '')
 
-        if score is not None:
+        if score not in (None, ''):
+            User.apply_review_change(review.reviewee_id, 0, int(score) - review.score)
             review.score = score
 
         if comment:
             review.comment = comment
+            User.bump_version(User.id == review.reviewee_id)
 
         db.session.commit()
 
-        reviewee = User.query.get(review.reviewee_id)
-        reviewee.calculate_average_score()
-        db.session.commit()
-
         return jsonify({
             'msg': 'Review updated successfully',
             'review_id': review.id,
@@ -533,7 +776,7 @@ def update_review(review_id):
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-@app.route('/reviews/<int:review_id>', methods=['DELETE'])
+@main.route('/reviews/<int:review_id>', methods=['DELETE'])
 @jwt_required()
 def delete_review(review_id):
     try:
@@ -544,11 +787,8 @@ def delete_review(review_id):
             return jsonify({'msg': 'Review not found or not authorized'}), 404
 
         db.session.delete(review)
-        db.session.commit()
-
         # Recalcular el puntaje promedio
-        reviewee = User.query.get(review.reviewee_id)
-        reviewee.calculate_average_score()
+        User.apply_review_change(review.reviewee_id, -1, -review.score)
         db.session.commit()
 
         return jsonify({'msg': 'Review deleted successfully', 'review_id': review.id}), 200
@@ -558,39 +798,43 @@ def delete_review(review_id):
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-@app.route('/bestsharers', methods=['GET'])
+@main.route('/bestsharers', methods=['GET'])
 def best_sharers():
-    try:
-        users = User.query.all()
-
-        users_with_scores = [
-            (user, user.calculate_average_score())  # Calcula el promedio directamente
-            for user in users
-        ]
+    limit = request.args.get('limit', BEST_SHARERS_DEFAULT, type=int)
+    limit = max(1, min(limit, BEST_SHARERS_MAX))
+    fields = get_user_fields()
 
-        sorted_users = sorted(users_with_scores, key=lambda x: x[1], reverse=True)
-
-        top_users = sorted_users[:6]  # Obtén los mejores 6 usuarios
+    try:
+        # The leaderboard is kept up to date on every review change
+        top_users = query_user_rows(BestSharers.media_average, fields=fields).join(
+            BestSharers, BestSharers.id == User.id
+        ).order_by(
+            BestSharers.media_average.desc(), BestSharers.id
+        ).limit(limit).all()
 
         if not top_users:
             return jsonify({'msg': 'No users found'}), 404
 
-        return jsonify({
+        return json_response({
             'best_sharers': [
                 {
                     'user': {
-                        'average_score': average_score,
-                        **user.serialize()  # Serializa el usuario y añade el average_score
+                        **({'average_score': row.media_average} if fields is None or 'average_score' in fields else {}),
+                        **user  # Serializa el usuario y añade el average_score
                     }
-                } for user, average_score in top_users
+                } for row, user in zip(top_users, serialize_user_rows(top_users, fields))
             ]
-        }), 200
+        })
     except Exception as e:
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-@app.route('/user/<int:user_id>/reviews', methods=['GET'])
+@main.route('/user/<int:user_id>/reviews', methods=['GET'])
 def get_user_reviews(user_id):
+    etag = user_etag('reviews', user_id)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
     # Obtener todas las reseñas del usuario específico
     reviews = Review.query.filter_by(reviewee_id=user_id).all()
     
@@ -601,7 +845,7 @@ def get_user_reviews(user_id):
     reviewers_dict = {user.id: {'name': user.name, 'last_name': user.last_name, 'profile_pic': user.profile_pic} for user in reviewers_info}
 
     # Devolver las reseñas junto con la información del revisor
-    return jsonify({
+    response = jsonify({
         'reviews': [
             {
                 'id': review.id,
@@ -611,45 +855,59 @@ def get_user_reviews(user_id):
                 'reviewer_info': reviewers_dict.get(review.reviewer_id, {})
             } for review in reviews
         ]
-    }), 200
+    })
+    if etag is not None:
+        with_etag(response, etag)
+    return response, 200
 
 
 #MATCHS (Adding people):
 
-# Obtener solicitudes de match según el tipo (entrantes, salientes, aceptadas)
-@app.route('/match', methods=['GET'])
+MATCHES_PAGE_DEFAULT = 50
+MATCHES_PAGE_MAX = 200
+
+# Obtener solicitudes de match según el tipo (entrantes, salientes, aceptadas o todas)
+@main.route('/match', methods=['GET'])
 @jwt_required()
+@read_primary
 def get_matches():
     try:
         user_id = get_jwt_identity()
         match_type = request.args.get('type')
-
-        if match_type == 'incoming':
-            matches = Match.query.filter_by(match_to_id=user_id, match_status=MatchStatus.PENDING.value).all()
-        elif match_type == 'outgoing':
-            matches = Match.query.filter_by(match_from_id=user_id, match_status=MatchStatus.PENDING.value).all()
-        elif match_type == 'accepted':
-            matches = Match.query.filter(
-                ((Match.match_from_id == user_id) | (Match.match_to_id == user_id)),
-                Match.match_status == MatchStatus.ACCEPTED.value
-            ).all()
-        else:
+        if match_type not in MATCH_TYPES and match_type != 'all':
             return jsonify({'msg': 'Invalid match type'}), 400
 
-        matches_data = [{
-            'match_id': match.match_id,
-            'match_from_id': match.match_from_id,
-            'match_to_id': match.match_to_id,
-            'match_status': match.match_status
-        } for match in matches]
-
-        return jsonify(matches_data), 200
+        # ?include=user embeds the profile of the other user (narrowed with ?fields=) in every match
+        include = request.args.get('include')
+        if include not in (None, 'user'):
+            return jsonify({'msg': 'Include must be "user"'}), 400
+        include_users = include == 'user'
+        fields = get_user_fields() if include_users else None
+
+        # Without paging or embedding it's the plain list of every match, as before
+        if match_type != 'all' and not include_users and not {'limit', 'after'} & request.args.keys():
+            return json_response(serialize_match_rows(match_rows(user_id, match_type)))
+
+        # Keyset pagination on match_id: ?limit=&after=<next_cursor>, type=all returns the first page of each type
+        if match_type == 'all' and 'after' in request.args:
+            return jsonify({'msg': 'Use type=incoming|outgoing|accepted with after'}), 400
+        limit, after_id = get_page_args(MATCHES_PAGE_DEFAULT, MATCHES_PAGE_MAX)
+
+        pages = {}
+        for page_type in MATCH_TYPES if match_type == 'all' else [match_type]:
+            rows = match_rows(user_id, page_type, after_id, limit, include_users, fields)
+            pages[page_type] = {
+                'matches': serialize_match_rows(rows[:limit], include_users, fields),
+                'next_cursor': encode_cursor(rows[limit - 1].match_id) if len(rows) > limit else None
+            }
+        return json_response(pages if match_type == 'all' else pages[match_type])
 
+    except APIException:
+        raise
     except Exception as e:
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
-
-@app.route('/match', methods=['POST'])
+@main.route('/match', methods=['POST'])
 @jwt_required()
 def create_match():
     try:
@@ -685,16 +943,13 @@ def create_match():
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
-@app.route('/match/<int:match_id>', methods=['PUT'])
+@main.route('/match/<int:match_id>', methods=['PUT'])
 @jwt_required()
 def update_match(match_id):
-    print("Entrando en la función update_match")
     try:
         user_id = get_jwt_identity()
-        print(f"User ID: {user_id}, Match ID: {match_id}")
-        
         match = Match.query.get(match_id)
-        print(f"Match found: {match}")
+        logger.debug('update_match', extra={'user_id': user_id, 'match_id': match_id, 'found': match is not None})
 
         if not match:
             return jsonify({'msg': 'Match not found'}), 404
@@ -703,24 +958,27 @@ def update_match(match_id):
             return jsonify({'msg': 'You can only update your own matches'}), 403
 
         match_status = request.json.get('match_status')
-        print(f"Received match_status: {match_status}")
-        
+        logger.debug('update_match status received', extra={'match_id': match_id, 'match_status': match_status})
+
         if match_status not in [status.value for status in MatchStatus]:
             return jsonify({'msg': 'Invalid match status'}), 400
 
+        was_accepted = match.match_status == MatchStatus.ACCEPTED.value
         match.match_status = match_status
+        if was_accepted != (match_status == MatchStatus.ACCEPTED.value):
+            Connection.sync_pair(match.match_from_id, match.match_to_id)
         db.session.commit()
 
         return jsonify({'msg': 'Match status updated successfully'}), 200
 
     except Exception as e:
         db.session.rollback()
-        print(f"Error: {str(e)}")
+        logger.exception('update_match failed', extra={'match_id': match_id})
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
 
 
 
-@app.route('/match/<int:match_id>', methods=['DELETE'])
+@main.route('/match/<int:match_id>', methods=['DELETE'])
 @jwt_required()
 def delete_match(match_id):
     try:
@@ -734,6 +992,8 @@ def delete_match(match_id):
             return jsonify({'msg': 'Match not found or not authorized'}), 404
 
         db.session.delete(match)
+        if match.match_status == MatchStatus.ACCEPTED.value:
+            Connection.sync_pair(match.match_from_id, match.match_to_id)
         db.session.commit()
 
         return jsonify({'msg': 'Match request canceled successfully'}), 200
@@ -745,34 +1005,99 @@ def delete_match(match_id):
 
 
 
+#CONNECTIONS (accepted matches, see api/connections.py):
+
+CONNECTIONS_PAGE_DEFAULT = 50
+CONNECTIONS_PAGE_MAX = 200
+SUGGESTIONS_DEFAULT = 10
+SUGGESTIONS_MAX = 50
+
+@main.route('/connections/<int:user_id>', methods=['GET'])
+def list_connections(user_id):
+    # Keyset pagination on the connected user id: ?limit=&after=<next_cursor>, ?fields= as in /users
+    limit, after_id = get_page_args(CONNECTIONS_PAGE_DEFAULT, CONNECTIONS_PAGE_MAX)
+    fields = get_user_fields()
+    users = connection_rows(user_id, after_id, limit, fields)
+    return json_response({
+        'users': serialize_user_rows(users[:limit], fields),
+        'next_cursor': encode_cursor(users[limit - 1].id) if len(users) > limit else None
+    })
+
+@main.route('/connections/<int:user_id>/count', methods=['GET'])
+def count_connections(user_id):
+    return jsonify({'user_id': user_id, 'connections': connection_count(user_id)}), 200
+
+@main.route('/connections/<int:user_id>/mutual/<int:other_id>', methods=['GET'])
+def list_mutual_connections(user_id, other_id):
+    limit, after_id = get_page_args(CONNECTIONS_PAGE_DEFAULT, CONNECTIONS_PAGE_MAX)
+    fields = get_user_fields()
+    users = mutual_rows(user_id, other_id, after_id, limit, fields)
+    return json_response({
+        'users': serialize_user_rows(users[:limit], fields),
+        'next_cursor': encode_cursor(users[limit - 1].id) if len(users) > limit else None,
+        'count': mutual_count(user_id, other_id)
+    })
+
+@main.route('/connections/suggestions', methods=['GET'])
+@jwt_required()
+def connection_suggestions():
+    # People your connections are connected to, most mutual connections first
+    limit = request.args.get('limit', SUGGESTIONS_DEFAULT, type=int)
+    limit = max(1, min(limit, SUGGESTIONS_MAX))
+    fields = get_user_fields()
+    rows = suggestion_rows(current_user.id, limit, fields)
+    users = serialize_user_rows(rows, fields)
+    for user, row in zip(users, rows):
+        user['mutual_connections'] = row[-1]
+    return json_response({'users': users})
+
+
+#RECOMMENDATIONS:
+
+RECOMMENDATIONS_DEFAULT = 10
+
+@main.route('/recommendations', methods=['GET'])
+@jwt_required()
+def recommendations():
+    # NumPy is only imported by the processes that serve recommendations (api/recommendations.py)
+    from api.recommendations import recommend, skill_names, MAX_RESULTS
+    limit = request.args.get('limit', RECOMMENDATIONS_DEFAULT, type=int)
+    limit = max(1, min(limit, MAX_RESULTS))
+    fields = get_user_fields()
+
+    ranking = recommend(current_user.id)[:limit]
+    users = {row.id: row for row in query_user_rows(fields=fields).filter(User.id.in_([user_id for user_id, *_ in ranking]))}
+    ranking = [entry for entry in ranking if entry[0] in users]
+    results = serialize_user_rows([users[user_id] for user_id, *_ in ranking], fields)
+    for user, (_, score, learn, teach) in zip(results, ranking):
+        user['score'] = round(score, 3)
+        user['skills_to_learn'] = skill_names(learn)
+        user['skills_to_teach'] = skill_names(teach)
+    return json_response({'users': results})
+
+
 #FLASK-MAIL
 
-@app.route('/send-email', methods=['POST'])
+@main.route('/send-email', methods=['POST'])
 def send_mail():
     data = request.json
-    print(f"Received email request: {data}")  # Log para depuración
     recipient_email = data.get('email')
 
     if not recipient_email:
         return jsonify({'msg': 'Email is required'}), 400
 
-    msg = Message(
-        subject="TEMA DEL CORREO",
-        recipients=[recipient_email],
-        sender=os.getenv("MAIL_USERNAME")
-    )
-    msg.html = render_template('email.html')
-
     try:
-        mail.send(msg)
-        print(f"Email sent to: {recipient_email}")  # Log para confirmar envío
-        return jsonify({'msg': 'Email sent successfully!'}), 200
+        queue_email(recipient_email, "TEMA DEL CORREO", render_template('email.html'))
+        db.session.commit()
+        logger.info('Email queued', extra={'recipient': recipient_email})
+        return jsonify({'msg': 'Email queued successfully!'}), 202
     except Exception as e:
-        print(f"Error sending email: {e}")  # Log para errores
+        db.session.rollback()
+        logger.exception('Error queueing email', extra={'recipient': recipient_email})
         return jsonify({'msg': 'Failed to send email', 'error': str(e)}), 500
 
 
-@app.route('/reset-password', methods=['POST'])
+@main.route('/reset-password', methods=['POST'])
 def reset_password():
     try:
         email = request.json.get('email')
@@ -794,19 +1119,15 @@ def reset_password():
                 expires_at=expiration
             )
             db.session.add(token_record)
-            db.session.commit()
 
             jwt_token = create_access_token(identity={'reset_token': reset_token}, expires_delta=timedelta(hours=1))
             reset_link = f'{os.getenv("FRONTEND_URL")}resetpassword?token={jwt_token}'
-            print(f"Reset link: {reset_link}")  # Añade este print para ver si se genera bien el enlace
+            # El enlace lleva el token, solo se registra que se ha generado
+            logger.info('Password reset link generated', extra={'user_id': user.id})
 
-            msg = Message(
-                subject="Password Reset Request",
-                recipients=[email],
-                sender=os.getenv("MAIL_USERNAME")
-            )
-            msg.html = render_template('emailpassword.html', reset_link=reset_link)
-            mail.send(msg)
+            # The email is committed together with the token
+            queue_email(email, "Password Reset Request", render_template('emailpassword.html', reset_link=reset_link))
+            db.session.commit()
 
             return jsonify({'msg': 'Password reset email sent successfully'}), 200
 
@@ -833,13 +1154,16 @@ def reset_password():
             if len(new_password) < 8:
                 return jsonify({'msg': 'Password must be at least 8 characters long'}), 400
 
-            pw_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+            pw_hash = bcrypt.generate_password_hash(new_password)
             user.password = pw_hash
             db.session.delete(token_record)
             db.session.commit()
             
             return jsonify({'msg': 'Password has been reset successfully'}), 200
 
+    except APIException:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'msg': 'An error occurred', 'error': str(e)}), 500
@@ -848,4 +1172,4 @@ def reset_password():
 # this only runs if `$ python src/main.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3001))
-    app.run(host='0.0.0.0', port=PORT, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=PORT, debug=True)
\ No newline at end of file
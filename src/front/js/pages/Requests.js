@@ -1,56 +1,17 @@
-import React, { useContext, useEffect, useState } from 'react';
+import React, { useContext, useEffect } from 'react';
 import { Context } from '../store/appContext';
 import "../../styles/requests.css";
 import { useNavigate } from 'react-router-dom';
 
 const RequestsPage = () => {
     const { store, actions } = useContext(Context);
-    const [userProfiles, setUserProfiles] = useState({});
     const navigate = useNavigate();
 
     useEffect(() => {
-        const fetchRequests = async () => {
-            await actions.getRequests('incoming');
-            await actions.getRequests('outgoing');
-            await actions.getRequests('accepted');
-        };
-
-        fetchRequests();
+        // Every request comes with the profile of the other user
+        actions.getInbox();
     }, []);
 
-    const fetchUserProfile = async (userId) => {
-        if (!userProfiles[userId]) { // Verify if we already have user
-            const userProfile = await actions.getUserProfile(userId);
-            if (userProfile) {
-                setUserProfiles(prev => ({ ...prev, [userId]: userProfile }));
-            }
-        }
-    };
-
-    useEffect(() => {
-        if (store.incomingRequests) {
-            store.incomingRequests.forEach(request => {
-                fetchUserProfile(request.match_from_id);
-            });
-        }
-    }, [store.incomingRequests]);
-
-    useEffect(() => {
-        if (store.outgoingRequests) {
-            store.outgoingRequests.forEach(request => {
-                fetchUserProfile(request.match_to_id);
-            });
-        }
-    }, [store.outgoingRequests]);
-
-    useEffect(() => {
-        if (store.acceptedContacts) {
-            store.acceptedContacts.forEach(contact => {
-                fetchUserProfile(contact.match_from_id || contact.match_to_id);
-            });
-        }
-    }, [store.acceptedContacts]);
-
     return (
         <div className="container requests-container ">
             <div className="secondNavbar">
@@ -75,7 +36,7 @@ const RequestsPage = () => {
                 <div className="request-list">
                     {store.incomingRequests && store.incomingRequests.length > 0 ? (
                         store.incomingRequests.map((request) => {
-                            const userFrom = userProfiles[request.match_from_id] || {};
+                            const userFrom = request.user || {};
 
                             return (
                                 <div className="request-item" key={`incoming-${request.match_id}`}>
@@ -111,7 +72,7 @@ const RequestsPage = () => {
                 <div className="request-list">
                     {store.outgoingRequests && store.outgoingRequests.length > 0 ? (
                         store.outgoingRequests.map((request) => {
-                            const userTo = userProfiles[request.match_to_id] || {};
+                            const userTo = request.user || {};
 
                             return (
                                 <div className="request-item" key={`outgoing-${request.match_id}`}>
@@ -144,10 +105,10 @@ const RequestsPage = () => {
                 <div className="contacts-list">
                     {store.acceptedContacts && store.acceptedContacts.length > 0 ? (
                         store.acceptedContacts.map((contact) => {
-                            const userContact = userProfiles[contact.match_from_id || contact.match_to_id] || {};
+                            const userContact = contact.user || {};
 
                             return (
-                                <div className="contact-item" key={`contact-${contact.id}`}>
+                                <div className="contact-item" key={`contact-${contact.match_id}`}>
                                     <img
                                         className="request-img"
                                         src={userContact.profile_pic || "https://via.placeholder.com/150https://res.cloudinary.com/dam4qhxjr/image/upload/v1726943109/PlaceholderImg_qok6jr.png"}
@@ -1,5 +1,20 @@
 import Swal from 'sweetalert2';
 
+// The lists are paginated with ?after=<next_cursor>, fetch every page (from cursor on) into one array
+const fetchAllPages = async (url, { key = 'users', cursor = null, options } = {}) => {
+    const items = [];
+    do {
+        const response = await fetch(cursor ? `${url}&after=${cursor}` : url, options);
+        const data = await response.json();
+        if (!response.ok || !data?.[key]) {
+            return { ok: false, data, items };
+        }
+        items.push(...data[key]);
+        cursor = data.next_cursor;
+    } while (cursor);
+    return { ok: true, items };
+};
+
 const getState = ({ getStore, getActions, setStore }) => {
     return {
         store: {
@@ -295,12 +310,11 @@ const getState = ({ getStore, getActions, setStore }) => {
 
             getAllUsers: async () => {
                 try {
-                    const response = await fetch(`${process.env.BACKEND_URL}users`);
-                    const data = await response.json();
-                    if (response.ok && data?.users) {
+                    const { ok, data, items: users } = await fetchAllPages(`${process.env.BACKEND_URL}users?limit=500`);
+                    if (ok) {
                         const currentUsers = getStore().users;
-                        if (JSON.stringify(currentUsers) !== JSON.stringify(data.users)) {
-                            setStore({ users: data.users });
+                        if (JSON.stringify(currentUsers) !== JSON.stringify(users)) {
+                            setStore({ users });
                         }
                     } else {
                         Swal.fire('Error', data?.msg || "Error fetching all users", 'error');
@@ -313,10 +327,20 @@ const getState = ({ getStore, getActions, setStore }) => {
             searchUsers: async (query) => {
                 if (!query) return;
                 try {
-                    const response = await fetch(`${process.env.BACKEND_URL}search/users?query=${query}`);
-                    const data = await response.json();
-                    if (response.ok && data?.users) {
-                        setStore({ users: data.users });
+                    // Ranked pages of ?page=1, 2...: a short page is the last one, a 404 after the first means no more
+                    const pageSize = 200;
+                    const users = [];
+                    let page = 1;
+                    let response, data;
+                    do {
+                        response = await fetch(`${process.env.BACKEND_URL}search/users?query=${encodeURIComponent(query)}&limit=${pageSize}&page=${page}`);
+                        data = await response.json();
+                        if (!response.ok || !data?.users) break;
+                        users.push(...data.users);
+                        page += 1;
+                    } while (data.users.length === pageSize);
+                    if (users.length > 0) {
+                        setStore({ users });
                     } else {
                         Swal.fire('Error', data?.msg || "Error searching users", 'error');
                     }
@@ -328,10 +352,9 @@ const getState = ({ getStore, getActions, setStore }) => {
             searchUsersBySkill: async (skill) => {
                 if (!skill) return;
                 try {
-                    const response = await fetch(`${process.env.BACKEND_URL}search/usersbyskill?skill=${skill}`);
-                    const data = await response.json();
-                    if (response.ok && data?.users) {
-                        setStore({ users: data.users });
+                    const { ok, items: users } = await fetchAllPages(`${process.env.BACKEND_URL}search/usersbyskill?skill=${encodeURIComponent(skill)}&limit=200`);
+                    if (ok) {
+                        setStore({ users });
                     } else {
                         setStore({ users: [] });
                     }
@@ -396,6 +419,46 @@ const getState = ({ getStore, getActions, setStore }) => {
                 }
             },
 
+            // Action: the three lists of the Requests page, with the other user's profile embedded, in one request
+            getInbox: async () => {
+                const token = localStorage.getItem('jwt-token');
+                const options = {
+                    method: 'GET',
+                    headers: {
+                        Authorization: 'Bearer ' + token,
+                        'Content-Type': 'application/json',
+                    },
+                };
+                try {
+                    const response = await fetch(`${process.env.BACKEND_URL}match?type=all&include=user&limit=200`, options);
+                    const data = await response.json();
+                    if (!response.ok) {
+                        Swal.fire('Error', data?.msg || 'Error fetching requests', 'error');
+                        return;
+                    }
+                    // type=all only has the first page of every type, the rest follow their own next_cursor
+                    const [incoming, outgoing, accepted] = await Promise.all(['incoming', 'outgoing', 'accepted'].map(async (type) => {
+                        const { matches, next_cursor } = data[type];
+                        if (!next_cursor) return { ok: true, items: matches };
+                        const rest = await fetchAllPages(`${process.env.BACKEND_URL}match?type=${type}&include=user&limit=200`,
+                            { key: 'matches', cursor: next_cursor, options });
+                        return { ...rest, items: [...matches, ...rest.items] };
+                    }));
+                    const failed = [incoming, outgoing, accepted].find((page) => !page.ok);
+                    if (failed) {
+                        Swal.fire('Error', failed.data?.msg || 'Error fetching requests', 'error');
+                    } else {
+                        setStore({
+                            incomingRequests: incoming.items,
+                            outgoingRequests: outgoing.items,
+                            acceptedContacts: accepted.items
+                        });
+                    }
+                } catch (error) {
+                    Swal.fire('Error', 'Error fetching requests', 'error');
+                }
+            },
+
             getMatchStatus: async (publicUserId) => {
                 const token = localStorage.getItem('jwt-token');
                 try {
@@ -474,8 +537,7 @@ const getState = ({ getStore, getActions, setStore }) => {
                     const data = await response.json();
                     if (response.ok) {
                         Swal.fire('Success', 'Match request accepted!', 'success');
-                        getActions().getRequests('incoming');
-                        getActions().getRequests('accepted');
+                        getActions().getInbox();
                     } else {
                         Swal.fire('Error', data?.msg || 'Error accepting match request.', 'error');
                     }
@@ -497,7 +559,7 @@ const getState = ({ getStore, getActions, setStore }) => {
                     const data = await response.json();
                     if (response.ok) {
                         Swal.fire('Success', 'Match request declined.', 'success');
-                        getActions().getRequests('incoming');
+                        getActions().getInbox();
                     } else {
                         Swal.fire('Error', data?.msg || 'Error declining match request.', 'error');
                     }
@@ -519,7 +581,7 @@ const getState = ({ getStore, getActions, setStore }) => {
                     const data = await response.json();
                     if (response.ok) {
                         Swal.fire('Success', 'Friend request cancelled.', 'success');
-                        getActions().getRequests('outgoing');
+                        getActions().getInbox();
                     } else {
                         Swal.fire('Error', data?.msg || 'Error cancelling friend request.', 'error');
                     }
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings, picked up automatically because the Procfile runs gunicorn with --chdir ./src/.
+
+The app is imported once in the master and forked into the workers (preload_app), so workers start
+without importing anything and share the loaded code. Set GUNICORN_PRELOAD=0 to import it in every
+worker instead. PORT and WEB_CONCURRENCY keep working as usual.
+
+Every worker builds its /autocomplete prefix index before taking requests.
+"""
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    # Never share pooled connections with the master, the worker opens its own
+    from wsgi import application
+    from api.models import db
+    with application.app_context():
+        for bind in [None, *(application.config.get('SQLALCHEMY_BINDS') or {})]:
+            db.get_engine(application, bind=bind).dispose(close=False)
+
+
+def post_worker_init(worker):
+    from wsgi import application
+    from api.models import db
+    with application.app_context():
+        try:
+            application.extensions['autocomplete'].build()
+        except Exception:
+            # The first lookup builds it then, a worker shouldn't die because of it
+            worker.log.exception('autocomplete index build failed')
+        finally:
+            db.session.remove()
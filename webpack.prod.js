@@ -4,7 +4,10 @@ const Dotenv = require('dotenv-webpack');
 module.exports = merge(common, {
     mode: 'production',
     output: {
-        publicPath: '/'
+        // The content hash lets the server cache the bundles forever (src/api/static_files.py)
+        filename: '[name].[contenthash].js',
+        publicPath: '/',
+        clean: true
     },
     plugins: [
         new Dotenv({